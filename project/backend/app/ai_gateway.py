@@ -0,0 +1,296 @@
+"""Server-side gateway for the AI calls the frontend used to make directly.
+
+Symptom analyses are cached on a normalized key (sorted, lower-cased symptoms
+plus a hash of the whitespace-normalized description) and concurrent identical
+requests share a single upstream call. Chat replies are streamed token by token.
+The upstream is pluggable: Hugging Face's OpenAI-compatible router when
+HUGGINGFACE_API_KEY is set, or a local stub model (AI_MODEL_BACKEND=stub) with
+configurable latency for offline benchmarking.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from typing import AsyncIterator, List
+
+from dotenv import load_dotenv
+
+from app.core.cache import TaggedTTLCache
+from app.schemas import SymptomAnalysisOut
+
+load_dotenv()
+
+HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
+AI_MODEL_BACKEND = os.getenv("AI_MODEL_BACKEND", "huggingface" if HUGGINGFACE_API_KEY else "stub")
+AI_MODEL_NAME = os.getenv("AI_MODEL_NAME", "meta-llama/Llama-3.1-8B-Instruct:sambanova")
+AI_API_URL = os.getenv("AI_API_URL", "https://router.huggingface.co/v1/chat/completions")
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", 30))
+AI_CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", 24 * 3600))
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", 10_000))
+AI_STUB_LATENCY_MS = float(os.getenv("AI_STUB_LATENCY_MS", 800))
+# Chat history forwarded upstream: the most recent messages that fit both limits
+AI_CHAT_MAX_HISTORY_MESSAGES = int(os.getenv("AI_CHAT_MAX_HISTORY_MESSAGES", 20))
+AI_CHAT_MAX_HISTORY_CHARS = int(os.getenv("AI_CHAT_MAX_HISTORY_CHARS", 8000))
+AI_CHAT_MAX_MESSAGE_CHARS = int(os.getenv("AI_CHAT_MAX_MESSAGE_CHARS", 4000))
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful medical AI assistant. Provide accurate, empathetic health information. "
+    "Always remind users to consult healthcare professionals for diagnosis and treatment."
+)
+
+CRITICAL_SYMPTOMS = ["chest pain", "severe bleeding", "unconscious", "not breathing", "seizure", "stroke"]
+HIGH_PRIORITY_SYMPTOMS = ["fever", "difficulty breathing", "severe pain", "vomiting", "dehydration"]
+PRIORITIES = {"urgent", "high", "medium", "low"}
+
+
+def build_analysis_prompt(symptoms: List[str], description: str) -> str:
+    return f"""You are a medical AI assistant helping to triage patient symptoms. Analyze the following and respond in JSON format.
+
+Symptoms: {', '.join(symptoms)}
+Description: {description}
+
+Provide a JSON response with:
+{{
+  "priority": "urgent|high|medium|low",
+  "recommendation": "2-3 sentences of medical advice",
+  "specialty": "recommended medical specialty",
+  "followUpQuestions": ["5-7 relevant questions for the doctor"]
+}}
+
+Priority levels:
+- urgent: Life-threatening, needs immediate ER (chest pain, severe bleeding, loss of consciousness)
+- high: Serious but not immediately life-threatening (high fever, severe pain, difficulty breathing)
+- medium: Moderate symptoms needing attention within days (persistent headache, mild fever)
+- low: Minor symptoms (single mild symptom, general discomfort)
+
+Respond ONLY with valid JSON, no other text."""
+
+
+def fallback_analysis(symptoms: List[str], description: str) -> dict:
+    """Rule-based triage, used when the model is unavailable and by the stub model."""
+    text = " ".join(symptoms).lower() + " " + description.lower()
+    if any(c in text for c in CRITICAL_SYMPTOMS):
+        return {
+            "priority": "urgent",
+            "recommendation": "Seek immediate emergency medical attention. Call emergency services or go to the nearest emergency room immediately.",
+            "specialty": "Emergency Medicine",
+            "follow_up_questions": [
+                "When did these symptoms start?",
+                "Have you experienced this before?",
+                "Are you taking any medications?",
+            ],
+        }
+    if any(h in text for h in HIGH_PRIORITY_SYMPTOMS):
+        return {
+            "priority": "high",
+            "recommendation": "Please consult with a healthcare provider within 24 hours. Your symptoms require medical attention.",
+            "specialty": "General Practitioner",
+            "follow_up_questions": [
+                "When did these symptoms begin?",
+                "Have you taken any medication?",
+                "Do you have any chronic conditions?",
+            ],
+        }
+    return {
+        "priority": "medium",
+        "recommendation": "Please schedule an appointment with a healthcare provider within the next few days to discuss your symptoms.",
+        "specialty": "General Practitioner",
+        "follow_up_questions": [
+            "How long have you had these symptoms?",
+            "Have the symptoms gotten worse?",
+            "Are you experiencing any other issues?",
+        ],
+    }
+
+
+def parse_analysis(content: str) -> dict:
+    """Raises ValueError unless the reply has the shape SymptomAnalysisOut expects,
+    so a malformed answer is never cached."""
+    parsed = json.loads(re.sub(r"```json\n?|\n?```", "", content).strip())
+    if not isinstance(parsed, dict):
+        raise ValueError("Analysis is not a JSON object")
+    analysis = {
+        "priority": parsed.get("priority") or "medium",
+        "recommendation": parsed.get("recommendation") or "Please consult with a healthcare provider.",
+        "specialty": parsed.get("specialty") or "General Practitioner",
+        "follow_up_questions": parsed.get("followUpQuestions") or [],
+    }
+    if analysis["priority"] not in PRIORITIES:
+        raise ValueError(f"Unknown priority {analysis['priority']!r}")
+    if not isinstance(analysis["follow_up_questions"], list) or not all(
+        isinstance(question, str) for question in analysis["follow_up_questions"]
+    ):
+        raise ValueError("followUpQuestions is not a list of strings")
+    # strict: no coercing numbers into the text fields. ValidationError is a ValueError.
+    return SymptomAnalysisOut.model_validate(analysis, strict=True).model_dump(exclude={"cached"})
+
+
+def trim_history(history: list[dict]) -> list[dict]:
+    """Most recent messages within AI_CHAT_MAX_HISTORY_MESSAGES and AI_CHAT_MAX_HISTORY_CHARS."""
+    kept, chars = [], 0
+    for message in reversed(history[-AI_CHAT_MAX_HISTORY_MESSAGES:]):
+        chars += len(message["content"])
+        if chars > AI_CHAT_MAX_HISTORY_CHARS:
+            break
+        kept.append(message)
+    return kept[::-1]
+
+
+def analysis_key(symptoms: List[str], description: str) -> str:
+    normalized_symptoms = sorted({s.strip().lower() for s in symptoms if s.strip()})
+    normalized_description = " ".join(description.lower().split())
+    description_hash = hashlib.sha256(normalized_description.encode()).hexdigest()
+    return "|".join(normalized_symptoms) + "#" + description_hash
+
+
+# =====================
+# MODELS
+# =====================
+
+class HuggingFaceModel:
+    """Chat completions against Hugging Face's OpenAI-compatible inference router."""
+
+    def __init__(self, api_key: str, model: str = AI_MODEL_NAME, url: str = AI_API_URL):
+        try:
+            import httpx
+        except ImportError:
+            raise RuntimeError("AI_MODEL_BACKEND=huggingface requires the httpx package")
+        self.model = model
+        self.url = url
+        self.client = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=AI_TIMEOUT_SECONDS,
+        )
+
+    async def complete(self, messages: list[dict], max_tokens: int = 500) -> str:
+        response = await self.client.post(self.url, json={
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+        })
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"] or ""
+
+    async def stream(self, messages: list[dict], max_tokens: int = 500) -> AsyncIterator[str]:
+        payload = {"model": self.model, "messages": messages, "max_tokens": max_tokens, "stream": True}
+        async with self.client.stream("POST", self.url, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
+class StubModel:
+    """Offline stand-in: answers from the rule-based triage after a fixed latency."""
+
+    def __init__(self, latency_ms: float = AI_STUB_LATENCY_MS):
+        self.latency = latency_ms / 1000
+
+    async def complete(self, messages: list[dict], max_tokens: int = 500) -> str:
+        await asyncio.sleep(self.latency)
+        prompt = messages[-1]["content"]
+        symptoms = re.search(r"^Symptoms: (.*)$", prompt, re.MULTILINE)
+        description = re.search(r"^Description: (.*)$", prompt, re.MULTILINE)
+        analysis = fallback_analysis(
+            symptoms.group(1).split(", ") if symptoms else [],
+            description.group(1) if description else prompt,
+        )
+        analysis["followUpQuestions"] = analysis.pop("follow_up_questions")
+        return json.dumps(analysis)
+
+    async def stream(self, messages: list[dict], max_tokens: int = 500) -> AsyncIterator[str]:
+        reply = (
+            "I'm a local test model. I can't give medical advice, "
+            "so please consult a healthcare professional about: " + messages[-1]["content"]
+        )
+        words = reply.split(" ")[:max_tokens]
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield word if i == 0 else " " + word
+
+
+def create_model():
+    if AI_MODEL_BACKEND == "huggingface":
+        if not HUGGINGFACE_API_KEY:
+            raise RuntimeError("HUGGINGFACE_API_KEY not set")
+        return HuggingFaceModel(HUGGINGFACE_API_KEY)
+    return StubModel()
+
+
+# =====================
+# GATEWAY
+# =====================
+
+class AIGateway:
+    def __init__(self, model):
+        self.model = model
+        self.cache = TaggedTTLCache(ttl_seconds=AI_CACHE_TTL_SECONDS, max_entries=AI_CACHE_MAX_ENTRIES)
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.stats = {"requests": 0, "hits": 0, "coalesced": 0, "upstream_calls": 0,
+                      "upstream_errors": 0, "upstream_seconds": 0.0, "chat_streams": 0}
+
+    async def analyze_symptoms(self, symptoms: List[str], description: str) -> tuple[dict, bool]:
+        """Returns (analysis, cached)."""
+        self.stats["requests"] += 1
+        key = analysis_key(symptoms, description)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached, True
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            # Shared model answers count as cached; a shared fallback doesn't.
+            return await asyncio.shield(task)
+
+        # The upstream call runs as its own task, so a disconnecting client
+        # doesn't cancel it for the other requests waiting on the same key.
+        task = asyncio.create_task(self._analyze_upstream(symptoms, description))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        analysis, _ = await asyncio.shield(task)
+        return analysis, False
+
+    async def _analyze_upstream(self, symptoms: List[str], description: str) -> tuple[dict, bool]:
+        """Returns (analysis, cached)."""
+        messages = [{"role": "user", "content": build_analysis_prompt(symptoms, description)}]
+        self.stats["upstream_calls"] += 1
+        started = time.perf_counter()
+        try:
+            analysis = parse_analysis(await self.model.complete(messages))
+        except Exception:
+            # Fallbacks are returned but not cached, so the next request retries upstream.
+            self.stats["upstream_errors"] += 1
+            return fallback_analysis(symptoms, description), False
+        finally:
+            self.stats["upstream_seconds"] += time.perf_counter() - started
+        self.cache.set(analysis_key(symptoms, description), analysis)
+        return analysis, True
+
+    async def chat(self, message: str, history: list[dict]) -> AsyncIterator[str]:
+        messages = [
+            {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+            *trim_history(history),
+            {"role": "user", "content": message},
+        ]
+        self.stats["chat_streams"] += 1
+        async for token in self.model.stream(messages):
+            yield token
+
+    def snapshot(self) -> dict:
+        stats = dict(self.stats)
+        requests = stats["requests"] or 1
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / requests
+        stats["avg_upstream_seconds"] = stats["upstream_seconds"] / (stats["upstream_calls"] or 1)
+        return stats
+
+
+gateway = AIGateway(create_model())
@@ -0,0 +1,385 @@
+"""Bulk import of patients, doctors and historical appointments.
+
+The upload is read as a stream of CSV (with a header row) or NDJSON records and
+processed IMPORT_CHUNK_SIZE rows at a time: each chunk is validated, checked
+against existing emails with one query, has its passwords hashed on a thread
+pool and is written with multi-row INSERTs in its own transaction. Parsing the
+next chunk overlaps with writing the previous one. A chunk the database
+rejects (say, an email registered in the meantime) is rolled back on its own
+and all its rows are reported as failed; chunks already committed stay in. Imported
+appointments are historical records, so no outbox events (and thus no
+notifications) are raised for them.
+"""
+import asyncio
+import codecs
+import csv
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.auth import hash_password
+from app.core.cache import invalidate_dashboards
+from app.core.response_cache import invalidate_responses
+from app.database import SessionLocal
+from app.models import Appointment, Doctor, Patient, User
+from app.reminders import scheduler as reminder_scheduler
+from app.schemas import AppointmentImportRow, DoctorImportRow, PatientImportRow
+
+load_dotenv()
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 1000))
+# Upper bound on one CSV record (a quoted field may span lines), so an unclosed
+# quote can't buffer the rest of the upload.
+IMPORT_MAX_RECORD_CHARS = int(os.getenv("IMPORT_MAX_RECORD_CHARS", 1_000_000))
+# Each Argon2 hash holds its memory cost (64 MiB with passlib's defaults) while it
+# runs, so this also bounds the import's peak memory.
+IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", min(8, os.cpu_count() or 1)))
+
+IMPORT_SCHEMAS = {
+    "patients": PatientImportRow,
+    "doctors": DoctorImportRow,
+    "appointments": AppointmentImportRow,
+}
+APPOINTMENT_STATUSES = {"scheduled", "completed", "cancelled"}
+
+# argon2-cffi releases the GIL while hashing, so threads hash in parallel.
+hash_pool = ThreadPoolExecutor(max_workers=IMPORT_HASH_WORKERS, thread_name_prefix="import-hash")
+
+
+# =====================
+# PARSING
+# =====================
+
+async def iter_lines(chunks: AsyncIterator[bytes], keepends: bool = False) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n" if keepends else line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer if keepends else buffer.rstrip("\r")
+
+
+class _NeedMore(Exception):
+    """Raised into csv.reader when a record continues past the lines received so far."""
+
+
+class CsvParser:
+    """Incremental CSV parsing: lines are pushed as they arrive and read by one
+    csv.reader, so quoting (quoted newlines, stray quotes in unquoted cells)
+    follows the csv module exactly. A record that is still open at the end of
+    the upload or after IMPORT_MAX_RECORD_CHARS is reported as failed, and
+    parsing resumes on the line after its first one."""
+
+    def __init__(self):
+        # Lines of the record being read, then any lines after it
+        self._lines: list[str] = []
+        self._chars = 0
+        self._pos = 0
+        self._waiting = False
+        self._closed = False
+        self._truncated = False
+        self._reader = csv.reader(self)
+        self._header = None
+        self._row = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if self._pos < len(self._lines):
+            self._pos += 1
+            return self._lines[self._pos - 1]
+        if not self._closed:
+            raise _NeedMore
+        # End of upload in the middle of a (quoted) record
+        self._truncated = self._pos > 0
+        raise StopIteration
+
+    def push(self, line: str) -> list[tuple[int, dict | None, str | None]]:
+        self._lines.append(line)
+        self._chars += len(line)
+        if self._waiting and '"' not in line and self._chars <= IMPORT_MAX_RECORD_CHARS:
+            # Without a quote the open quoted field can't have ended.
+            return []
+        return list(self._records())
+
+    def close(self) -> list[tuple[int, dict | None, str | None]]:
+        self._closed = True
+        return list(self._records())
+
+    def _consume(self, count: int) -> None:
+        self._chars -= sum(len(line) for line in self._lines[:count])
+        del self._lines[:count]
+        self._waiting = False
+
+    def _read(self):
+        """Yields (values, error) for each record complete in the buffer."""
+        while self._lines:
+            self._pos, self._truncated = 0, False
+            try:
+                values = next(self._reader)
+            except _NeedMore:
+                if self._chars <= IMPORT_MAX_RECORD_CHARS:
+                    self._waiting = True
+                    return
+                error = f"Record is longer than {IMPORT_MAX_RECORD_CHARS} characters"
+            except StopIteration:
+                return
+            except csv.Error as e:
+                error = str(e)
+            else:
+                if not self._truncated:
+                    self._consume(self._pos)
+                    yield values, None
+                    continue
+                error = "Unterminated quoted field"
+            self._consume(1)
+            yield None, error
+
+    def _records(self):
+        for values, error in self._read():
+            if error:
+                self._row += 1
+                yield self._row, None, error
+                continue
+            if not any(value.strip() for value in values):
+                continue
+            if self._header is None:
+                self._header = [name.strip() for name in values]
+                continue
+            self._row += 1
+            if len(values) != len(self._header):
+                yield self._row, None, f"Expected {len(self._header)} columns, got {len(values)}"
+                continue
+            # Empty cells fall back to the schema defaults.
+            yield self._row, {name: value for name, value in zip(self._header, values) if value != ""}, None
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """Yields (row number, record, parse error); rows are numbered from 1, not counting the CSV header."""
+    row = 0
+    if fmt == "ndjson":
+        async for line in iter_lines(chunks):
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield row, None, "Expected a JSON object"
+                continue
+            yield row, record, None
+        return
+
+    parser = CsvParser()
+    async for line in iter_lines(chunks, keepends=True):
+        for record in parser.push(line):
+            yield record
+    for record in parser.close():
+        yield record
+
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}" for e in error.errors()
+    )
+
+
+# =====================
+# IMPORTER
+# =====================
+
+class BulkImporter:
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.schema = IMPORT_SCHEMAS[kind]
+        self.total = 0
+        self.imported = 0
+        self.errors: list[dict] = []
+        # Emails claimed by earlier rows of this upload
+        self.seen_emails: set[str] = set()
+
+    def fail(self, row: int, error: str) -> None:
+        self.errors.append({"row": row, "error": error})
+
+    def validate(self, batch: list[tuple[int, dict | None, str | None]]) -> list[tuple[int, BaseModel]]:
+        valid = []
+        for row, record, error in batch:
+            self.total += 1
+            if error:
+                self.fail(row, error)
+                continue
+            try:
+                valid.append((row, self.schema(**record)))
+            except ValidationError as e:
+                self.fail(row, format_validation_error(e))
+        return valid
+
+    def import_chunk(self, batch: list[tuple[int, dict | None, str | None]]) -> None:
+        rows = self.validate(batch)
+        if not rows:
+            return
+        db = SessionLocal()
+        try:
+            if self.kind == "appointments":
+                self._import_appointments(db, rows)
+            else:
+                self._import_users(db, rows)
+        finally:
+            db.close()
+
+    def _write(self, db, rows: list[tuple[int, BaseModel]], *statements) -> bool:
+        """Run the chunk's INSERTs and commit as one transaction. If the database
+        rejects any of it, roll back and report every row of the chunk as failed."""
+        try:
+            for statement in statements:
+                db.execute(statement)
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            message = f"Chunk rolled back: {str(getattr(e, 'orig', None) or e).strip().splitlines()[0]}"
+            for row, _ in rows:
+                self.fail(row, message)
+            return False
+        self.imported += len(rows)
+        return True
+
+    def _import_users(self, db, rows: list[tuple[int, BaseModel]]) -> None:
+        candidates = []
+        for row, record in rows:
+            if record.email in self.seen_emails:
+                self.fail(row, "Duplicate email in upload")
+                continue
+            self.seen_emails.add(record.email)
+            candidates.append((row, record))
+        if not candidates:
+            return
+
+        emails = [record.email for _, record in candidates]
+        existing = set(db.execute(select(User.email).where(User.email.in_(emails))).scalars())
+        if existing:
+            for row, record in candidates:
+                if record.email in existing:
+                    self.fail(row, "Email already registered")
+            candidates = [(row, record) for row, record in candidates if record.email not in existing]
+            if not candidates:
+                return
+
+        hashes = hash_pool.map(hash_password, [record.password for _, record in candidates])
+        role = self.kind[:-1]
+        users, profiles = [], []
+        for (_, record), password_hash in zip(candidates, hashes):
+            user_id = uuid.uuid4()
+            users.append({
+                "id": user_id,
+                "email": record.email,
+                "full_name": record.full_name,
+                "role": role,
+                "password_hash": password_hash,
+            })
+            profile = record.model_dump(exclude={"email", "full_name", "password"})
+            profile["user_id"] = user_id
+            profiles.append(profile)
+
+        written = self._write(
+            db, candidates,
+            insert(User).values(users),
+            insert(Patient if self.kind == "patients" else Doctor).values(profiles),
+        )
+        if not written:
+            # Let later rows with these emails be tried again.
+            self.seen_emails.difference_update(record.email for _, record in candidates)
+        elif self.kind == "doctors":
+            invalidate_dashboards("doctors")
+            invalidate_responses("doctors")
+
+    def _import_appointments(self, db, rows: list[tuple[int, BaseModel]]) -> None:
+        emails = {record.patient_email for _, record in rows} | {record.doctor_email for _, record in rows}
+        patients, doctors = {}, {}
+        lookup = (
+            select(User.email, User.id, Patient.id.label("patient_id"), Doctor.id.label("doctor_id"))
+            .outerjoin(Patient, Patient.user_id == User.id)
+            .outerjoin(Doctor, Doctor.user_id == User.id)
+            .where(User.email.in_(emails))
+        )
+        for email, user_id, patient_id, doctor_id in db.execute(lookup):
+            if patient_id:
+                patients[email] = (patient_id, user_id)
+            if doctor_id:
+                doctors[email] = (doctor_id, user_id)
+
+        candidates, appointments = [], []
+        for row, record in rows:
+            if record.patient_email not in patients:
+                self.fail(row, f"No patient with email {record.patient_email}")
+                continue
+            if record.doctor_email not in doctors:
+                self.fail(row, f"No doctor with email {record.doctor_email}")
+                continue
+            if record.status not in APPOINTMENT_STATUSES:
+                self.fail(row, f"status: must be one of {', '.join(sorted(APPOINTMENT_STATUSES))}")
+                continue
+            candidates.append((row, record))
+            appointments.append({
+                "id": uuid.uuid4(),
+                "patient_id": patients[record.patient_email][0],
+                "doctor_id": doctors[record.doctor_email][0],
+                **record.model_dump(exclude={"patient_email", "doctor_email"}),
+            })
+        if not candidates:
+            return
+
+        if not self._write(db, candidates, insert(Appointment).values(appointments)):
+            return
+
+        invalidate_dashboards(
+            *{f"patient:{a['patient_id']}" for a in appointments},
+            *{f"doctor:{a['doctor_id']}" for a in appointments},
+        )
+        user_ids = {patients[r.patient_email][1] for _, r in candidates} | {doctors[r.doctor_email][1] for _, r in candidates}
+        invalidate_responses("appointments:admin", *(f"appointments:{user_id}" for user_id in user_ids))
+        for values in appointments:
+            if values["status"] == "scheduled":
+                reminder_scheduler.schedule(Appointment(**values))
+
+    def report(self) -> dict:
+        return {
+            "kind": self.kind,
+            "total": self.total,
+            "imported": self.imported,
+            "failed": len(self.errors),
+            "errors": sorted(self.errors, key=lambda e: e["row"]),
+        }
+
+
+async def run_import(kind: str, chunks: AsyncIterator[bytes], fmt: str) -> dict:
+    importer = BulkImporter(kind)
+    writing = None
+    batch = []
+    async for record in iter_records(chunks, fmt):
+        batch.append(record)
+        if len(batch) >= IMPORT_CHUNK_SIZE:
+            # One chunk in flight at a time, so seen_emails is never shared between threads.
+            if writing is not None:
+                await writing
+            writing = asyncio.create_task(asyncio.to_thread(importer.import_chunk, batch))
+            batch = []
+    if writing is not None:
+        await writing
+    if batch:
+        await asyncio.to_thread(importer.import_chunk, batch)
+    return importer.report()
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+
+class TaggedTTLCache:
+    """Small thread-safe cache whose entries expire after a TTL and can be
+    dropped in bulk by tag (e.g. "patient:<id>") when the underlying rows change.
+
+    A reader that computes a value from the database takes a `snapshot()` first
+    and passes it to `set(..., since=...)`: if any of the entry's tags was
+    invalidated in between, the value may predate that write and is not stored."""
+
+    def __init__(self, ttl_seconds: float = 30, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, Any, frozenset]]" = OrderedDict()
+        self._tags: dict[str, set[str]] = {}
+        # Invalidation clock and the clock value of each tag's last invalidation.
+        # When _invalidated outgrows its bound it is cleared and _floor moves up:
+        # snapshots older than _floor are then treated as stale.
+        self._clock = 0
+        self._floor = 0
+        self._invalidated: dict[str, int] = {}
+        self._max_invalidated = max_entries * 16
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def snapshot(self) -> int:
+        with self._lock:
+            return self._clock
+
+    def set(self, key: str, value: Any, tags: Iterable[str] = (), since: Optional[int] = None) -> bool:
+        """Store `value`; with `since`, only if none of `tags` was invalidated after that snapshot."""
+        tags = frozenset(tags)
+        with self._lock:
+            if since is not None and (
+                since < self._floor or any(self._invalidated.get(tag, 0) > since for tag in tags)
+            ):
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def invalidate_tags(self, *tags: str) -> None:
+        with self._lock:
+            self._clock += 1
+            for tag in tags:
+                self._invalidated[tag] = self._clock
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+            if len(self._invalidated) > self._max_invalidated:
+                self._invalidated.clear()
+                self._floor = self._clock
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._clock += 1
+            self._invalidated.clear()
+            self._floor = self._clock
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+# Per-user dashboard payloads. Entries are tagged with the user, patient and
+# doctor ids they were built from so routers can drop them on write.
+dashboard_cache = TaggedTTLCache(
+    ttl_seconds=float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", 30)),
+    max_entries=int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", 2048)),
+)
+
+
+def invalidate_dashboards(*tags: str) -> None:
+    dashboard_cache.invalidate_tags(*tags)
@@ -0,0 +1,26 @@
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from jose import JWTError, jwt
+from starlette.requests import Request
+
+load_dotenv()
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+
+
+def principal_from_request(request: Request) -> Optional[dict]:
+    """Verified {"sub", "role"} from the bearer token, or None.
+    Used by middleware that runs before the routers' own auth dependencies."""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("sub") is None:
+        return None
+    return {"sub": str(payload["sub"]), "role": payload.get("role")}
@@ -0,0 +1,315 @@
+"""Opt-in request profiling and slow-request capture.
+
+Off unless PROFILING_ENABLED=true: main.py then adds ProfilingMiddleware and
+calls `instrument()` on the routers, so with the flag off nothing is installed
+and requests pay nothing.
+
+With it on, every request is timed (wall time, CPU time of sync endpoints,
+and each SQL statement with its duration; statement text only, never
+parameters). Requests carrying `X-Profile: 1` from an admin, plus a random
+PROFILE_SAMPLE_RATE share of all requests, are also sampled every
+PROFILE_SAMPLE_INTERVAL_MS by a background thread reading the endpoint thread's
+stack. Profiled requests and any request slower than SLOW_REQUEST_THRESHOLD_MS
+are kept in a ring buffer of SLOW_REQUEST_BUFFER_SIZE entries, served by
+/admin/profiling. Async endpoints share the event loop thread, so their samples
+can include other requests that ran concurrently.
+"""
+import functools
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+
+from app.core.principal import principal_from_request
+
+load_dotenv()
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 5))
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", 1000))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", 200))
+PROFILE_MAX_STATEMENTS = 500
+STATEMENT_MAX_LENGTH = 2000
+
+current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+
+# Compared and hashed by identity: profiles are kept in the sampler's set.
+@dataclass(eq=False)
+class RequestProfile:
+    method: str
+    path: str
+    reason: Optional[str]  # "header" or "sampled" when stacks are sampled
+    user_id: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    started_at: datetime = field(default_factory=datetime.utcnow)
+    status_code: Optional[int] = None
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    sql_seconds: float = 0.0
+    sql_count: int = 0
+    statements: list = field(default_factory=list)
+    samples: Counter = field(default_factory=Counter)
+    # Threads currently running this request's endpoint
+    threads: set = field(default_factory=set)
+
+    @property
+    def sampled(self) -> bool:
+        return self.reason is not None
+
+    def add_statement(self, statement: str, seconds: float, executemany: bool) -> None:
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        if len(self.statements) < PROFILE_MAX_STATEMENTS:
+            self.statements.append({
+                "sql": " ".join(statement.split())[:STATEMENT_MAX_LENGTH],
+                "ms": round(seconds * 1000, 3),
+                "executemany": executemany,
+            })
+
+    def summary(self) -> dict:
+        wall_ms = self.wall_seconds * 1000
+        cpu_ms = self.cpu_seconds * 1000
+        sql_ms = self.sql_seconds * 1000
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "user_id": self.user_id,
+            "started_at": self.started_at.isoformat(),
+            "reason": self.reason or "slow",
+            "wall_ms": round(wall_ms, 3),
+            "cpu_ms": round(cpu_ms, 3),
+            "sql_ms": round(sql_ms, 3),
+            # Time spent neither on the endpoint's CPU nor in SQL: awaiting I/O, pool, queues
+            "other_ms": round(max(0.0, wall_ms - cpu_ms - sql_ms), 3),
+            "sql_count": self.sql_count,
+            "samples": sum(self.samples.values()),
+        }
+
+    def detail(self) -> dict:
+        return {
+            **self.summary(),
+            "statements": self.statements,
+            "stacks": [{"stack": stack, "count": count} for stack, count in self.samples.most_common(50)],
+        }
+
+    def collapsed_stacks(self) -> list[str]:
+        root = f"{self.method} {self.path}"
+        return [f"{root};{stack} {count}" for stack, count in self.samples.items()]
+
+
+# =====================
+# STACK SAMPLER
+# =====================
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = "/".join(code.co_filename.replace("\\", "/").rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def collapse(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """One daemon thread that samples the stacks of every profiled request; exits when none are left."""
+
+    def __init__(self, interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self._profiles: set[RequestProfile] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles.discard(profile)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                profiles = list(self._profiles)
+            frames = sys._current_frames()
+            for profile in profiles:
+                for ident in list(profile.threads):
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        profile.samples[collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+sampler = StackSampler()
+
+
+# =====================
+# CAPTURE BUFFER
+# =====================
+
+class ProfileBuffer:
+    def __init__(self, size: int = SLOW_REQUEST_BUFFER_SIZE):
+        self._items: deque[RequestProfile] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._items.append(profile)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((p for p in self._items if p.id == profile_id), None)
+
+    def query(self, path: Optional[str] = None, min_ms: float = 0, reason: Optional[str] = None,
+              limit: int = 50) -> list[RequestProfile]:
+        """Newest first."""
+        with self._lock:
+            items = list(self._items)
+        matches = [
+            p for p in reversed(items)
+            if (path is None or p.path.startswith(path))
+            and p.wall_seconds * 1000 >= min_ms
+            and (reason is None or (p.reason or "slow") == reason)
+        ]
+        return matches[:limit]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+profiles = ProfileBuffer()
+
+
+# =====================
+# HOOKS
+# =====================
+
+# The start time lives on the statement's execution context, which is dropped
+# with the statement, so one that raises leaves nothing behind on the connection.
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None and context is not None:
+        context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    started = getattr(context, "_profile_started", None)
+    if profile is not None and started is not None:
+        profile.add_statement(statement, time.perf_counter() - started, executemany)
+
+
+def _timed_endpoint(call):
+    """Register the thread running the endpoint with the request's profile and add its CPU time."""
+    if inspect.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def timed(*args, **kwargs):
+            profile = current_profile.get()
+            if profile is None:
+                return await call(*args, **kwargs)
+            ident = threading.get_ident()
+            profile.threads.add(ident)
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                profile.threads.discard(ident)
+        return timed
+
+    @functools.wraps(call)
+    def timed(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return call(*args, **kwargs)
+        ident = threading.get_ident()
+        profile.threads.add(ident)
+        cpu_started = time.thread_time()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            profile.cpu_seconds += time.thread_time() - cpu_started
+            profile.threads.discard(ident)
+    return timed
+
+
+def instrument(engine, *routers) -> None:
+    """Attach the SQL timing hooks and wrap the endpoints of the given routers."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    for router in routers:
+        for route in router.routes:
+            if isinstance(route, APIRoute):
+                route.endpoint = _timed_endpoint(route.endpoint)
+                route.dependant.call = route.endpoint
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        principal = principal_from_request(request)
+        reason = None
+        if request.headers.get(PROFILE_HEADER) and principal and principal["role"] == "admin":
+            reason = "header"
+        elif PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            reason = "sampled"
+
+        profile = RequestProfile(
+            method=request.method,
+            path=request.url.path,
+            reason=reason,
+            user_id=principal["sub"] if principal else None,
+        )
+        token = current_profile.set(profile)
+        if profile.sampled:
+            sampler.add(profile)
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            profile.wall_seconds = time.perf_counter() - started
+            current_profile.reset(token)
+            if profile.sampled:
+                sampler.remove(profile)
+
+        profile.status_code = response.status_code
+        if profile.sampled or profile.wall_seconds * 1000 >= SLOW_REQUEST_THRESHOLD_MS:
+            profiles.add(profile)
+        # Timings only go back to admin-requested and sampled requests; for
+        # everyone else they would leak internals.
+        if profile.sampled:
+            response.headers["Server-Timing"] = (
+                f"app;dur={profile.wall_seconds * 1000:.1f}, cpu;dur={profile.cpu_seconds * 1000:.1f}, "
+                f'db;dur={profile.sql_seconds * 1000:.1f};desc="{profile.sql_count} queries"'
+            )
+            response.headers["X-Profile-Id"] = profile.id
+        return response
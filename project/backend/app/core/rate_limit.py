@@ -0,0 +1,233 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from app.core.principal import principal_from_request
+from app.core.redis_client import CircuitBreaker, create_client
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory, redis
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+# Keep at or below the SQLAlchemy pool size + overflow (5 + 10 by default)
+# so excess requests are shed here instead of queueing on the pool.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 15))
+# /ai/ routes wait on the model, not the database, so they get their own cap
+# and a slow upstream can't push the rest of the API into 503s.
+MAX_CONCURRENT_AI_REQUESTS = int(os.getenv("MAX_CONCURRENT_AI_REQUESTS", 50))
+
+# "<requests>/<seconds>" per principal and route class, overridable with
+# RATE_LIMITS="auth=5/60,consultation=10/60".
+DEFAULT_RATE_LIMITS = {
+    "auth": "10/60",
+    "consultation": "20/60",
+    "ai": "30/60",
+    "admin": "60/60",
+    "write": "120/60",
+    "read": "600/60",
+}
+
+# Paths that bypass both limiters.
+EXEMPT_PATHS = {"/", "/health"}
+
+
+@dataclass
+class Limit:
+    capacity: float
+    refill_per_second: float
+
+
+def parse_limits(raw: str) -> dict[str, Limit]:
+    specs = dict(DEFAULT_RATE_LIMITS)
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        name, _, spec = item.partition("=")
+        specs[name.strip()] = spec.strip()
+    limits = {}
+    for name, spec in specs.items():
+        requests, _, seconds = spec.partition("/")
+        limits[name] = Limit(capacity=float(requests), refill_per_second=float(requests) / float(seconds or 1))
+    return limits
+
+
+RATE_LIMITS = parse_limits(os.getenv("RATE_LIMITS", ""))
+
+
+def route_class(request: Request, principal) -> str:
+    path, method = request.url.path, request.method
+    if path.startswith("/auth/"):
+        return "auth"
+    if method == "POST" and path.rstrip("/") == "/consultations":
+        return "consultation"
+    if method == "POST" and path.startswith("/ai/"):
+        return "ai"
+    if principal and principal["role"] == "admin":
+        return "admin"
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return "read"
+    return "write"
+
+
+# =====================
+# BUCKET STORES
+# =====================
+
+# Stores whose `take` blocks on the network set `blocking`; the middleware
+# runs those in a thread.
+
+class MemoryBucketStore:
+    """Token buckets in a bounded LRU dict; one lock-protected O(1) update per request."""
+
+    blocking = False
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit) -> float:
+        """Consume one token. Returns 0 if allowed, else seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_per_second)
+            if tokens >= 1:
+                wait = 0.0
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / limit.refill_per_second
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBucketStore:
+    """Token buckets shared by all workers, updated atomically by a Lua script."""
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, client):
+        self._take = client.register_script(self.SCRIPT)
+
+    def take(self, key: str, limit: Limit) -> float:
+        return float(self._take(
+            keys=["ratelimit:" + key],
+            args=[limit.capacity, limit.refill_per_second, time.time()],
+        ))
+
+
+class FailOpenBucketStore:
+    """Uses the shared store while it answers and per-process buckets while it
+    doesn't, so a Redis outage loosens limits instead of failing every request.
+    After a failure the shared store is left alone until the breaker closes."""
+
+    blocking = True
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+        self.breaker = CircuitBreaker("Rate limit store")
+
+    def take(self, key: str, limit: Limit) -> float:
+        if self.breaker.closed:
+            try:
+                return self.primary.take(key, limit)
+            except Exception:
+                self.breaker.failed()
+        return self.fallback.take(key, limit)
+
+
+def create_store():
+    if RATE_LIMIT_BACKEND == "redis":
+        client = create_client(RATE_LIMIT_REDIS_URL, "RATE_LIMIT_BACKEND=redis")
+        return FailOpenBucketStore(RedisBucketStore(client), MemoryBucketStore())
+    return MemoryBucketStore()
+
+
+store = create_store()
+
+
+def _rejection(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def _exempt(path: str, method: str) -> bool:
+    return not RATE_LIMIT_ENABLED or path in EXEMPT_PATHS or method == "OPTIONS"
+
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    """Per-principal token buckets by route class."""
+
+    async def dispatch(self, request: Request, call_next):
+        if _exempt(request.url.path, request.method):
+            return await call_next(request)
+
+        principal = principal_from_request(request)
+        name = route_class(request, principal)
+        who = f"user:{principal['sub']}" if principal else f"ip:{request.client.host if request.client else 'unknown'}"
+        key = f"{name}:{who}"
+        if store.blocking:
+            wait = await asyncio.to_thread(store.take, key, RATE_LIMITS[name])
+        else:
+            wait = store.take(key, RATE_LIMITS[name])
+        if wait > 0:
+            return _rejection(429, "Too many requests", wait)
+        return await call_next(request)
+
+
+class ConcurrencyLimitMiddleware:
+    """Global caps on in-flight requests that shed load with 503 before the DB
+    pool runs dry; /ai/ routes count against their own cap. Plain ASGI so a slot
+    is held until the response body has been sent, streams included. Added
+    inside the response cache, so cache hits never take a slot."""
+
+    def __init__(self, app):
+        self.app = app
+        self.limits = {"db": MAX_CONCURRENT_REQUESTS, "ai": MAX_CONCURRENT_AI_REQUESTS}
+        # Only touched from the event loop, so plain counters are enough.
+        self.in_flight = {pool: 0 for pool in self.limits}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _exempt(scope["path"], scope["method"]):
+            return await self.app(scope, receive, send)
+
+        pool = "ai" if scope["path"].startswith("/ai/") else "db"
+        if self.in_flight[pool] >= self.limits[pool]:
+            return await _rejection(503, "Server busy, please retry", 1)(scope, receive, send)
+        self.in_flight[pool] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight[pool] -= 1
@@ -0,0 +1,53 @@
+"""Redis client settings and failure handling shared by the rate limiter and
+the response cache.
+
+Both talk to Redis on the request path, so the client gets short socket
+timeouts, the calls run off the event loop, and callers go through a
+CircuitBreaker: after a failure Redis is bypassed for REDIS_RETRY_AFTER_SECONDS
+instead of being retried (and possibly timing out) on every request.
+"""
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", 0.25))
+REDIS_RETRY_AFTER_SECONDS = float(os.getenv("REDIS_RETRY_AFTER_SECONDS", 30))
+
+logger = logging.getLogger(__name__)
+
+
+def create_client(url: str, setting: str):
+    """`setting` names the option that asked for Redis, for the error when the package is missing."""
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError(f"{setting} requires the redis package")
+    return redis.Redis.from_url(
+        url,
+        socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+    )
+
+
+class CircuitBreaker:
+    """Open for `retry_after` seconds after each failure; callers skip the
+    dependency while it is open. Call `failed()` from the except block."""
+
+    def __init__(self, name: str, retry_after: float = REDIS_RETRY_AFTER_SECONDS):
+        self.name = name
+        self.retry_after = retry_after
+        self._open_until = 0.0
+
+    @property
+    def closed(self) -> bool:
+        return time.monotonic() >= self._open_until
+
+    def failed(self) -> None:
+        was_closed = self.closed
+        self._open_until = time.monotonic() + self.retry_after
+        if was_closed:
+            logger.exception("%s unavailable, bypassing it for %ss", self.name, self.retry_after)
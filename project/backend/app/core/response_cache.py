@@ -0,0 +1,335 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterable, Optional
+
+from dotenv import load_dotenv
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.cache import TaggedTTLCache
+from app.core.principal import principal_from_request
+from app.core.redis_client import CircuitBreaker, create_client
+
+load_dotenv()
+
+# "memory" is per worker: an invalidation only reaches the worker that handled
+# the write, so with several workers use "redis" or keep the TTL short.
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # memory, redis, local
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 300))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 4096))
+# How long SharedBackend keeps a tag's generation counter after its last invalidation
+GENERATION_TTL_SECONDS = 24 * 3600
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    media_type: str
+    etag: str
+    last_modified: float
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "body": base64.b64encode(self.body).decode("ascii"),
+            "media_type": self.media_type,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+        })
+
+    @classmethod
+    def from_json(cls, raw) -> "CachedResponse":
+        data = json.loads(raw)
+        data["body"] = base64.b64decode(data["body"])
+        return cls(**data)
+
+
+# =====================
+# BACKENDS
+# =====================
+
+# Every backend snapshots its invalidation state before the route runs and
+# only stores the response if none of its tags was invalidated since, so a
+# read that raced a write never caches the pre-write body. Backends whose calls
+# block on the network say so with `blocking`; the middleware runs those in a
+# thread.
+
+class MemoryBackend:
+    """Per-process LRU. Fast, but each worker has its own copy and only sees
+    invalidations issued by that worker."""
+
+    blocking = False
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self._cache = TaggedTTLCache(ttl_seconds=ttl_seconds, max_entries=max_entries)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        return self._cache.get(key)
+
+    def generations(self, tags: Iterable[str]) -> int:
+        return self._cache.snapshot()
+
+    def set(self, key: str, entry: CachedResponse, tags: Iterable[str], generations: int) -> None:
+        self._cache.set(key, entry, tags, since=generations)
+
+    def invalidate_tags(self, *tags: str) -> None:
+        self._cache.invalidate_tags(*tags)
+
+
+class SharedBackend:
+    """Cache shared by all workers, stored in a Redis-compatible client.
+    Tags are kept as sets of entry keys so a write can drop them in one round trip.
+    Fails open: after a client error the cache is bypassed (reads miss, nothing
+    is stored) until the breaker lets the next call through."""
+
+    prefix = "respcache:"
+    blocking = True
+
+    def __init__(self, client, ttl_seconds: int):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.breaker = CircuitBreaker("Response cache")
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        if not self.breaker.closed:
+            return None
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception:
+            self.breaker.failed()
+            return None
+        return CachedResponse.from_json(raw) if raw is not None else None
+
+    def generations(self, tags: Iterable[str]) -> Optional[tuple]:
+        tags = list(tags)
+        if not tags:
+            return ()
+        if not self.breaker.closed:
+            return None
+        try:
+            values = self.client.mget([self.prefix + "gen:" + tag for tag in tags])
+        except Exception:
+            self.breaker.failed()
+            return None
+        return tuple(int(value or 0) for value in values)
+
+    def set(self, key: str, entry: CachedResponse, tags: Iterable[str], generations: Optional[tuple]) -> None:
+        tags = list(tags)
+        if generations is None or self.generations(tags) != generations:
+            return
+        try:
+            self._store(key, entry, tags, generations)
+        except Exception:
+            self.breaker.failed()
+
+    def _store(self, key: str, entry: CachedResponse, tags: list[str], generations: tuple) -> None:
+        self.client.set(self.prefix + key, entry.to_json(), ex=self.ttl_seconds)
+        for tag in tags:
+            tag_key = self.prefix + "tag:" + tag
+            self.client.sadd(tag_key, self.prefix + key)
+            self.client.expire(tag_key, self.ttl_seconds)
+        # An invalidation between the check and the write either bumped the
+        # counter before this re-check, or deletes the entry after it.
+        if self.generations(tags) != generations:
+            self.client.delete(self.prefix + key)
+
+    def invalidate_tags(self, *tags: str) -> None:
+        # While the cache is bypassed, entries already written expire after ttl_seconds.
+        if not self.breaker.closed:
+            return
+        try:
+            self._invalidate(tags)
+        except Exception:
+            self.breaker.failed()
+
+    def _invalidate(self, tags) -> None:
+        for tag in tags:
+            gen_key = self.prefix + "gen:" + tag
+            self.client.incr(gen_key)
+            self.client.expire(gen_key, GENERATION_TTL_SECONDS)
+            tag_key = self.prefix + "tag:" + tag
+            keys = list(self.client.smembers(tag_key))
+            self.client.delete(tag_key, *keys)
+
+
+class LocalSharedStore:
+    """In-process stand-in for the Redis commands SharedBackend uses, so the
+    shared code path can run in development and tests without a server."""
+
+    def __init__(self):
+        self._values: dict[str, tuple[Optional[float], object]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        item = self._values.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._values[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._live(key)
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._live(key) for key in keys]
+
+    def incr(self, key):
+        with self._lock:
+            expires_at = self._values.get(key, (None, None))[0]
+            value = int(self._live(key) or 0) + 1
+            self._values[key] = (expires_at, value)
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._values[key] = (time.monotonic() + ex if ex else None, value)
+
+    def sadd(self, key, *members):
+        with self._lock:
+            members_set = self._live(key) or set()
+            members_set.update(members)
+            expires_at = self._values.get(key, (None, None))[0]
+            self._values[key] = (expires_at, members_set)
+
+    def smembers(self, key):
+        with self._lock:
+            return set(self._live(key) or ())
+
+    def expire(self, key, seconds):
+        with self._lock:
+            value = self._live(key)
+            if value is not None:
+                self._values[key] = (time.monotonic() + seconds, value)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+
+def create_backend():
+    if RESPONSE_CACHE_BACKEND == "redis":
+        client = create_client(RESPONSE_CACHE_REDIS_URL, "RESPONSE_CACHE_BACKEND=redis")
+        return SharedBackend(client, RESPONSE_CACHE_TTL_SECONDS)
+    if RESPONSE_CACHE_BACKEND == "local":
+        return SharedBackend(LocalSharedStore(), RESPONSE_CACHE_TTL_SECONDS)
+    return MemoryBackend(RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES)
+
+
+backend = create_backend()
+
+
+def invalidate_responses(*tags: str) -> None:
+    backend.invalidate_tags(*tags)
+
+
+async def _call_backend(fn, *args):
+    if backend.blocking:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+def _lookup(key: str, tags: list[str]) -> tuple[Optional[CachedResponse], object]:
+    """The cached entry, or (on a miss) None and the generations to store under."""
+    entry = backend.get(key)
+    if entry is not None:
+        return entry, None
+    return None, backend.generations(tags)
+
+
+# =====================
+# ROUTE POLICIES
+# =====================
+
+@dataclass
+class CachePolicy:
+    tags: tuple[str, ...]
+    # Roles whose response does not depend on who they are, so one entry
+    # serves every user with that role (e.g. verified doctors for patients).
+    shared_roles: tuple[str, ...] = ()
+
+
+_policies: dict[str, CachePolicy] = {}
+
+
+def cache_route(path: str, tags: Iterable[str], shared_roles: Iterable[str] = ()) -> None:
+    """Cache successful GET responses for `path`. Tags may use {sub} and {role}."""
+    _policies[path] = CachePolicy(tags=tuple(tags), shared_roles=tuple(shared_roles))
+
+
+def _not_modified(request: Request, entry: CachedResponse) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or entry.etag in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(entry.last_modified) <= since
+    return False
+
+
+def _respond(request: Request, entry: CachedResponse, status: str) -> Response:
+    headers = {
+        "ETag": entry.etag,
+        "Last-Modified": formatdate(entry.last_modified, usegmt=True),
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization",
+        "X-Cache": status,
+    }
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """Serves registered GET routes from the response cache, keyed by route,
+    principal scope and query string, and answers conditional requests with 304."""
+
+    async def dispatch(self, request: Request, call_next):
+        policy = _policies.get(request.url.path) if request.method == "GET" else None
+        if policy is None:
+            return await call_next(request)
+        principal = principal_from_request(request)
+        if principal is None:
+            return await call_next(request)
+
+        values = {"sub": principal["sub"], "role": principal["role"]}
+        scope = f"role:{principal['role']}" if principal["role"] in policy.shared_roles else f"user:{principal['sub']}"
+        query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+        key = f"{request.url.path}|{scope}|{query}"
+        tags = [tag.format(**values) for tag in policy.tags]
+
+        entry, generations = await _call_backend(_lookup, key, tags)
+        if entry is not None:
+            return _respond(request, entry, "HIT")
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        entry = CachedResponse(
+            body=body,
+            media_type=response.media_type or response.headers.get("content-type", "application/json"),
+            etag='"' + hashlib.sha1(body).hexdigest() + '"',
+            last_modified=time.time(),
+        )
+        await _call_backend(backend.set, key, entry, tags, generations)
+        return _respond(request, entry, "MISS")
@@ -1,11 +1,27 @@
+import asyncio
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import Base, engine
 from app.auth import router as auth_router
-from app.routers import consultations, patients, doctors, symptoms, appointments, notifications
+from app import notification_retention, outbox, reminders
+from app.core.profiling import PROFILING_ENABLED, ProfilingMiddleware, instrument
+from app.core.rate_limit import ConcurrencyLimitMiddleware, RateLimitMiddleware
+from app.core.response_cache import ResponseCacheMiddleware, cache_route
+from app.routers import consultations, patients, doctors, symptoms, appointments, notifications, dashboard, ai, imports, profiling
 
 app = FastAPI(title="CurelyTix Backend API", version="1.0.0")
 
+# Middleware added last runs first: CORS -> rate limiting -> profiling ->
+# response cache -> concurrency limit, so 429/503 and cached responses still
+# carry CORS headers, profiles include cache hits, and cache hits don't count
+# against the in-flight cap.
+app.add_middleware(ConcurrencyLimitMiddleware)
+app.add_middleware(ResponseCacheMiddleware)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(RateLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +41,36 @@ def on_startup():
         print(" Database connected and tables created")
     except Exception as e:
         print(" Database connection failed:", e)
+        return
+    try:
+        notification_retention.prepare_notifications_table()
+    except Exception as e:
+        print(" Preparing notification partitions failed:", e)
+
+
+# Background workers (disable with OUTBOX_WORKER_ENABLED=false,
+# NOTIFICATION_MAINTENANCE_ENABLED=false or REMINDERS_ENABLED=false when they
+# run elsewhere)
+_background_stop = asyncio.Event()
+
+@app.on_event("startup")
+async def start_background_workers():
+    app.state.background_tasks = []
+    if os.getenv("OUTBOX_WORKER_ENABLED", "true").lower() == "true":
+        app.state.background_tasks.append(asyncio.create_task(outbox.run_worker(_background_stop)))
+    if os.getenv("NOTIFICATION_MAINTENANCE_ENABLED", "true").lower() == "true":
+        app.state.background_tasks.append(
+            asyncio.create_task(notification_retention.run_maintenance_loop(_background_stop))
+        )
+    if os.getenv("REMINDERS_ENABLED", "true").lower() == "true":
+        app.state.background_tasks.append(asyncio.create_task(reminders.run_scheduler(_background_stop)))
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    _background_stop.set()
+    # return_exceptions so one crashed worker doesn't stop the others from being awaited
+    await asyncio.gather(*getattr(app.state, "background_tasks", []), return_exceptions=True)
 
 
 # Root endpoint
@@ -47,6 +93,15 @@ def health_check():
 
 # Routers
 
+# include_router builds the app's routes from each endpoint, so endpoints must
+# be wrapped for profiling before they are included.
+if PROFILING_ENABLED:
+    instrument(
+        engine,
+        app.router, auth_router, consultations.router, patients.router, doctors.router, symptoms.router,
+        appointments.router, notifications.router, dashboard.router, ai.router, imports.router, profiling.router,
+    )
+
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 app.include_router(consultations.router, prefix="/consultations", tags=["Consultations"])
 app.include_router(patients.router, prefix="/patients", tags=["Patients"])
@@ -54,3 +109,16 @@ app.include_router(doctors.router, prefix="/doctors", tags=["Doctors"])
 app.include_router(symptoms.router, prefix="/symptoms", tags=["Symptoms"])
 app.include_router(appointments.router, prefix="/appointments", tags=["Appointments"])
 app.include_router(notifications.router, prefix="/notifications", tags=["Notifications"])
+app.include_router(dashboard.router, prefix="/dashboard", tags=["Dashboard"])
+app.include_router(ai.router, prefix="/ai", tags=["AI"])
+app.include_router(imports.router, prefix="/admin/import", tags=["Admin"])
+app.include_router(profiling.router, prefix="/admin/profiling", tags=["Admin"])
+
+
+# Cached reads, invalidated by tag from the routers that write them
+
+cache_route("/doctors/", tags=["doctors"], shared_roles=["admin", "patient"])
+cache_route("/doctors/me", tags=["doctor-profile:{sub}"])
+cache_route("/patients/me", tags=["patient-profile:{sub}"])
+cache_route("/appointments/", tags=["appointments:{sub}", "appointments:{role}"], shared_roles=["admin"])
+cache_route("/appointments/upcoming", tags=["appointments:{sub}"])
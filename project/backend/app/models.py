@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Integer, Boolean, Date, ForeignKey, Text, ARRAY, DateTime, Time
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, Date, ForeignKey, Text, ARRAY, DateTime, Time, Index, LargeBinary, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 from .database import Base
 import uuid
@@ -73,7 +73,13 @@ class Appointment(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        # Window query of the reminder scheduler (app.reminders)
+        Index("ix_appointments_scheduled_date", "date", postgresql_where=text("status = 'scheduled'")),
+    )
+
 class Notification(Base):
+    """Range-partitioned by month on created_at; partitions are managed by app.notification_retention"""
     __tablename__ = "notifications"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
@@ -82,4 +88,38 @@ class Notification(Base):
     type = Column(String)  # info, warning, success, error
     is_read = Column(Boolean, default=False)
     link = Column(String)
+    created_at = Column(DateTime, default=func.now(), primary_key=True)  # partition key must be in the PK
+
+    __table_args__ = (
+        Index("ix_notifications_user_created", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+class NotificationArchive(Base):
+    """Cold storage for archived notifications: one gzip'd JSON batch per user and month"""
+    __tablename__ = "notification_archives"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), index=True)
+    period = Column(Date, nullable=False)  # first day of the month the notifications were created in
+    notification_count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, default=func.now())
+
+class OutboxEvent(Base):
+    """Side effects of a domain write, recorded in the same transaction and drained by app.outbox"""
+    __tablename__ = "outbox_events"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)  # sequential, gives per-aggregate order
+    aggregate_type = Column(String, nullable=False)  # appointment, consultation
+    aggregate_id = Column(UUID(as_uuid=True), nullable=False)
+    event_type = Column(String, nullable=False)  # appointment.created, appointment.cancelled, consultation.created
+    payload = Column(JSONB, nullable=False, default=dict)
+    status = Column(String, default="pending", nullable=False)  # pending, done, dead
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text)
+    available_at = Column(DateTime, default=func.now(), nullable=False)
     created_at = Column(DateTime, default=func.now())
+    processed_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_outbox_events_pending", "aggregate_id", "id", postgresql_where=text("status = 'pending'")),
+    )
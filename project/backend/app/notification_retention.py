@@ -0,0 +1,304 @@
+"""Monthly partitions, retention and archival for notifications.
+
+`notifications` is range-partitioned by month on created_at. Maintenance keeps
+partitions created a few months ahead, moves read notifications older than
+NOTIFICATION_ARCHIVE_AFTER_DAYS into gzip'd batches in `notification_archives`,
+and archives then drops whole partitions once they fall out of
+NOTIFICATION_RETENTION_DAYS. Rows are always archived in short batched
+transactions; DETACH (which locks the whole `notifications` table) only runs
+on an already emptied partition. `run_maintenance_loop` runs it as an asyncio task
+in the API process; `python -m app.notification_retention` runs it once (cron).
+Startup preparation and maintenance take a Postgres advisory lock, so several
+workers never create, convert or drop partitions at the same time.
+
+Lists show read notifications from the last NOTIFICATION_HOT_DAYS only, so
+Postgres can skip older partitions for them; unread notifications are never
+archived and stay listed (and counted) until read or dropped with their partition.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import insert, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+from app.database import engine
+from app.models import Notification, NotificationArchive
+
+load_dotenv()
+
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 180))
+NOTIFICATION_ARCHIVE_AFTER_DAYS = int(os.getenv("NOTIFICATION_ARCHIVE_AFTER_DAYS", 30))
+NOTIFICATION_HOT_DAYS = int(os.getenv("NOTIFICATION_HOT_DAYS", 30))
+NOTIFICATION_PARTITIONS_AHEAD = int(os.getenv("NOTIFICATION_PARTITIONS_AHEAD", 2))
+NOTIFICATION_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("NOTIFICATION_MAINTENANCE_INTERVAL_SECONDS", 6 * 3600))
+ARCHIVE_BATCH_SIZE = 5000
+# DETACH PARTITION waits at most this long for its lock: while it waits, every
+# notification query queues behind it. It is retried a few times, then left
+# for the next run.
+DETACH_LOCK_TIMEOUT = "250ms"
+DETACH_ATTEMPTS = 5
+DETACH_RETRY_SECONDS = 2
+# Arbitrary key shared by every process that changes notification partitions
+MAINTENANCE_LOCK_KEY = 7_305_114_002
+
+PARTITION_NAME = re.compile(r"^notifications_p(\d{4})_(\d{2})$")
+COLUMNS = "id, user_id, title, message, type, is_read, link, created_at"
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"notifications_p{month:%Y_%m}"
+
+
+def retention_cutoff() -> datetime:
+    """Partitions entirely older than this are archived and dropped."""
+    return datetime.utcnow() - timedelta(days=NOTIFICATION_RETENTION_DAYS)
+
+
+def hot_cutoff() -> datetime:
+    """Oldest created_at of read notifications still listed."""
+    return datetime.utcnow() - timedelta(days=NOTIFICATION_HOT_DAYS)
+
+
+# =====================
+# PARTITIONS
+# =====================
+
+def _table_kind(conn: Connection, name: str):
+    return conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": name}
+    ).scalar()
+
+
+def _partitions(conn: Connection) -> dict[str, date]:
+    rows = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('notifications')
+    """))
+    partitions = {}
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[name] = date(int(match.group(1)), int(match.group(2)), 1)
+    return partitions
+
+
+def _create_partition(conn: Connection, month: date) -> None:
+    # Built detached and attached afterwards so any rows that landed in the
+    # default partition for this month can be moved across first.
+    name, lower, upper = partition_name(month), month, add_months(month, 1)
+    conn.execute(text(f"CREATE TABLE {name} (LIKE notifications INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM notifications_default
+            WHERE created_at >= :lower AND created_at < :upper
+            RETURNING {COLUMNS}
+        )
+        INSERT INTO {name} ({COLUMNS}) SELECT {COLUMNS} FROM moved
+    """), {"lower": lower, "upper": upper})
+    conn.execute(text(
+        f"ALTER TABLE notifications ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    ))
+
+
+def ensure_partitions(conn: Connection, first_month: date | None = None) -> list[str]:
+    """Create the default partition and monthly partitions up to NOTIFICATION_PARTITIONS_AHEAD months out."""
+    conn.execute(text("CREATE TABLE IF NOT EXISTS notifications_default PARTITION OF notifications DEFAULT"))
+    existing = set(_partitions(conn))
+    this_month = month_start(datetime.utcnow())
+    month = first_month or this_month
+    created = []
+    while month <= add_months(this_month, NOTIFICATION_PARTITIONS_AHEAD):
+        if partition_name(month) not in existing:
+            _create_partition(conn, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def convert_legacy_table(conn: Connection) -> bool:
+    """Rebuild a pre-partitioning `notifications` table as a partitioned one, keeping its rows."""
+    if _table_kind(conn, "notifications") != "r":
+        return False
+    conn.execute(text("ALTER TABLE notifications RENAME TO notifications_unpartitioned"))
+    conn.execute(text("ALTER INDEX IF EXISTS notifications_pkey RENAME TO notifications_unpartitioned_pkey"))
+    Notification.__table__.create(conn)
+    oldest = conn.execute(text("SELECT min(created_at) FROM notifications_unpartitioned")).scalar()
+    ensure_partitions(conn, month_start(oldest) if oldest else None)
+    conn.execute(text(f"""
+        INSERT INTO notifications ({COLUMNS})
+        SELECT id, user_id, title, message, type, is_read, link, COALESCE(created_at, now())
+        FROM notifications_unpartitioned
+    """))
+    conn.execute(text("DROP TABLE notifications_unpartitioned"))
+    return True
+
+
+def _lock(conn: Connection) -> None:
+    """Serialize with other processes until the transaction ends."""
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+
+
+def prepare_notifications_table() -> None:
+    """Run once at startup, after create_all, so inserts always have a partition to land in."""
+    with engine.begin() as conn:
+        _lock(conn)
+        if convert_legacy_table(conn):
+            logger.info("Converted notifications to a partitioned table")
+        ensure_partitions(conn)
+
+
+# =====================
+# ARCHIVAL
+# =====================
+
+def _archive(conn: Connection, rows) -> None:
+    batches = defaultdict(list)
+    for row in rows:
+        batches[(row.user_id, month_start(row.created_at))].append({
+            "id": str(row.id),
+            "title": row.title,
+            "message": row.message,
+            "type": row.type,
+            "is_read": row.is_read,
+            "link": row.link,
+            "created_at": row.created_at.isoformat(),
+        })
+    if batches:
+        conn.execute(insert(NotificationArchive), [
+            {
+                "user_id": user_id,
+                "period": period,
+                "notification_count": len(items),
+                "data": gzip.compress(json.dumps(items).encode()),
+            }
+            for (user_id, period), items in batches.items()
+        ])
+
+
+def _archive_in_batches(table: str, condition: str = "true", params: dict | None = None) -> int:
+    """Move rows of `table` (the parent or one partition) matching `condition` to the archive,
+    ARCHIVE_BATCH_SIZE per transaction. Returns the number of rows moved."""
+    archived = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(f"""
+                WITH batch AS (
+                    SELECT id, created_at FROM {table}
+                    WHERE {condition}
+                    LIMIT :limit
+                )
+                DELETE FROM {table} n
+                USING batch
+                WHERE n.id = batch.id AND n.created_at = batch.created_at
+                RETURNING {', '.join('n.' + c for c in COLUMNS.split(', '))}
+            """), {**(params or {}), "limit": ARCHIVE_BATCH_SIZE}).all()
+            _archive(conn, rows)
+        archived += len(rows)
+        if len(rows) < ARCHIVE_BATCH_SIZE:
+            return archived
+
+
+def archive_read_notifications() -> int:
+    """Move read notifications older than NOTIFICATION_ARCHIVE_AFTER_DAYS to the archive, in batches."""
+    cutoff = datetime.utcnow() - timedelta(days=NOTIFICATION_ARCHIVE_AFTER_DAYS)
+    return _archive_in_batches("notifications", "is_read = true AND created_at < :cutoff", {"cutoff": cutoff})
+
+
+def _detach(name: str) -> bool:
+    for attempt in range(DETACH_ATTEMPTS):
+        if attempt:
+            time.sleep(DETACH_RETRY_SECONDS)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+                conn.execute(text(f"ALTER TABLE notifications DETACH PARTITION {name}"))
+            return True
+        except OperationalError:
+            continue
+    return False
+
+
+def drop_expired_partitions() -> list[str]:
+    """Archive and drop monthly partitions entirely older than NOTIFICATION_RETENTION_DAYS."""
+    cutoff = retention_cutoff()
+    dropped = []
+    with engine.connect() as conn:
+        partitions = _partitions(conn)
+    for name, month in sorted(partitions.items(), key=lambda item: item[1]):
+        if datetime.combine(add_months(month, 1), datetime.min.time()) > cutoff:
+            continue
+        _archive_in_batches(name)
+        # DETACH ... CONCURRENTLY isn't allowed while a default partition exists,
+        # so detach in a transaction of its own: with the partition empty it is
+        # only a catalog change and the parent's lock is released at once.
+        if not _detach(name):
+            logger.warning("Could not lock notifications to detach %s, retrying next run", name)
+            continue
+        # Rows written after the batches above; nothing else can reach the table now.
+        _archive_in_batches(name)
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
+
+
+def run_maintenance() -> dict:
+    """Skipped when another process is already running maintenance."""
+    with engine.connect() as lock_conn:
+        key = {"key": MAINTENANCE_LOCK_KEY}
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), key).scalar():
+            return {"skipped": "maintenance is running in another process"}
+        # Session-level lock: it outlives this transaction, which is closed so it doesn't sit idle.
+        lock_conn.commit()
+        try:
+            with engine.begin() as conn:
+                created = ensure_partitions(conn)
+            return {
+                "partitions_created": created,
+                "archived": archive_read_notifications(),
+                "partitions_dropped": drop_expired_partitions(),
+            }
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), key)
+            lock_conn.commit()
+
+
+async def run_maintenance_loop(stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            summary = await asyncio.to_thread(run_maintenance)
+            logger.info("Notification maintenance: %s", summary)
+        except Exception:
+            logger.exception("Notification maintenance failed")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=NOTIFICATION_MAINTENANCE_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    prepare_notifications_table()
+    print(run_maintenance())
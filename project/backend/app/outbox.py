@@ -0,0 +1,247 @@
+"""Transactional outbox.
+
+Routers call `enqueue` inside the same session as their domain write, so an
+event exists if and only if the write committed. `drain_once` claims a batch
+of pending events and runs their handlers; `run_worker` loops it as an asyncio
+task in the API process, and `python -m app.outbox` runs it as its own process.
+Processed events are deleted once they are OUTBOX_RETENTION_DAYS old; dead
+ones are kept for inspection.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import timedelta
+from typing import Callable, Iterable
+
+from dotenv import load_dotenv
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.cache import invalidate_dashboards
+from app.database import SessionLocal
+from app.models import Doctor, Notification, OutboxEvent, Patient
+
+load_dotenv()
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", 1))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))
+OUTBOX_PRUNE_INTERVAL_SECONDS = float(os.getenv("OUTBOX_PRUNE_INTERVAL_SECONDS", 3600))
+OUTBOX_PRUNE_BATCH_SIZE = 5000
+
+logger = logging.getLogger(__name__)
+
+# Namespace for deterministic ids of rows created by handlers, so a retried
+# event never produces the same side effect twice.
+OUTBOX_NAMESPACE = uuid.UUID("5b0f8a3e-2d4c-4e55-9a53-8f0f5c1d7e21")
+
+
+def enqueue(db: Session, aggregate_type: str, aggregate_id, event_type: str, payload: dict) -> None:
+    """Record an event in the caller's transaction. Commit is left to the caller."""
+    db.add(OutboxEvent(
+        aggregate_type=aggregate_type,
+        aggregate_id=aggregate_id,
+        event_type=event_type,
+        payload=payload,
+    ))
+
+
+# =====================
+# HANDLERS
+# =====================
+
+# Handlers return the ids of users whose notifications changed; their cached
+# dashboards are dropped once the batch has committed.
+
+def _notify(db: Session, event: OutboxEvent, notifications: list[dict]) -> list:
+    rows = [
+        {
+            "id": uuid.uuid5(OUTBOX_NAMESPACE, f"{event.id}:{n['user_id']}"),
+            "type": "info",
+            "is_read": False,
+            "link": None,
+            # Fixed created_at keeps (id, created_at), the partitioned table's key, stable across retries.
+            "created_at": event.created_at,
+            **n,
+        }
+        for n in notifications
+        if n["user_id"] is not None
+    ]
+    if rows:
+        db.execute(insert(Notification).values(rows).on_conflict_do_nothing(index_elements=["id", "created_at"]))
+    return [row["user_id"] for row in rows]
+
+
+def _appointment_user_ids(db: Session, payload: dict):
+    patient_user_id = db.query(Patient.user_id).filter(Patient.id == payload["patient_id"]).scalar()
+    doctor_user_id = db.query(Doctor.user_id).filter(Doctor.id == payload["doctor_id"]).scalar()
+    return patient_user_id, doctor_user_id
+
+
+def handle_appointment_created(db: Session, event: OutboxEvent) -> list:
+    p = event.payload
+    patient_user_id, doctor_user_id = _appointment_user_ids(db, p)
+    when = f"{p['date']} at {p['time']}"
+    return _notify(db, event, [
+        {
+            "user_id": patient_user_id,
+            "title": "Appointment booked",
+            "message": f"Your {p['type']} appointment is scheduled for {when}.",
+            "type": "success",
+            "link": f"/appointments/{event.aggregate_id}",
+        },
+        {
+            "user_id": doctor_user_id,
+            "title": "New appointment",
+            "message": f"A patient booked a {p['type']} appointment for {when}.",
+            "link": f"/appointments/{event.aggregate_id}",
+        },
+    ])
+
+
+def handle_appointment_cancelled(db: Session, event: OutboxEvent) -> list:
+    p = event.payload
+    patient_user_id, doctor_user_id = _appointment_user_ids(db, p)
+    message = f"The appointment on {p['date']} at {p['time']} has been cancelled."
+    return _notify(db, event, [
+        {"user_id": patient_user_id, "title": "Appointment cancelled", "message": message, "type": "warning"},
+        {"user_id": doctor_user_id, "title": "Appointment cancelled", "message": message, "type": "warning"},
+    ])
+
+
+def handle_consultation_created(db: Session, event: OutboxEvent) -> list:
+    p = event.payload
+    patient_user_id = db.query(Patient.user_id).filter(Patient.id == p["patient_id"]).scalar()
+    return _notify(db, event, [
+        {
+            "user_id": patient_user_id,
+            "title": "Consultation submitted",
+            "message": "Your consultation has been received and is waiting for a doctor.",
+            "type": "success",
+        },
+    ])
+
+
+HANDLERS: dict[str, Callable[[Session, OutboxEvent], Iterable]] = {
+    "appointment.created": handle_appointment_created,
+    "appointment.cancelled": handle_appointment_cancelled,
+    "consultation.created": handle_consultation_created,
+}
+
+
+# =====================
+# WORKER
+# =====================
+
+# Oldest pending event of each aggregate only, so events of one aggregate are
+# handled strictly in order even with several workers; SKIP LOCKED lets
+# workers share the table without blocking each other.
+CLAIM_SQL = text("""
+    SELECT e.id
+    FROM outbox_events e
+    WHERE e.status = 'pending'
+      AND e.available_at <= now()
+      AND NOT EXISTS (
+          SELECT 1 FROM outbox_events prior
+          WHERE prior.aggregate_id = e.aggregate_id
+            AND prior.status = 'pending'
+            AND prior.id < e.id
+      )
+    ORDER BY e.id
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+""")
+
+
+def drain_once(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """Process one batch in a single transaction. Returns the number of events claimed."""
+    db = SessionLocal()
+    try:
+        ids = [row[0] for row in db.execute(CLAIM_SQL, {"limit": batch_size})]
+        if not ids:
+            db.rollback()
+            return 0
+        events = db.query(OutboxEvent).filter(OutboxEvent.id.in_(ids)).order_by(OutboxEvent.id).all()
+        notified_user_ids = set()
+        for event in events:
+            handler = HANDLERS.get(event.event_type)
+            try:
+                with db.begin_nested():
+                    if handler is not None:
+                        notified_user_ids.update(handler(db, event) or ())
+            except Exception as e:
+                event.attempts += 1
+                event.last_error = str(e)
+                if event.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    event.status = "dead"
+                    logger.error("Outbox event %s (%s) failed permanently: %s", event.id, event.event_type, e)
+                else:
+                    event.available_at = func.now() + timedelta(seconds=2 ** event.attempts)
+                continue
+            event.status = "done"
+            event.processed_at = func.now()
+        db.commit()
+        # Only after commit: a dashboard read in between would re-cache the old unread count.
+        invalidate_dashboards(*(f"user:{user_id}" for user_id in notified_user_ids))
+        return len(events)
+    finally:
+        db.close()
+
+
+PRUNE_SQL = text("""
+    DELETE FROM outbox_events
+    WHERE id IN (
+        SELECT id FROM outbox_events
+        WHERE status = 'done' AND processed_at < now() - make_interval(days => :days)
+        ORDER BY id
+        LIMIT :limit
+    )
+""")
+
+
+def prune_processed(retention_days: int = OUTBOX_RETENTION_DAYS) -> int:
+    """Delete processed events older than the retention window, in batches. Returns rows deleted."""
+    deleted = 0
+    while True:
+        db = SessionLocal()
+        try:
+            count = db.execute(PRUNE_SQL, {"days": retention_days, "limit": OUTBOX_PRUNE_BATCH_SIZE}).rowcount
+            db.commit()
+        finally:
+            db.close()
+        deleted += count
+        if count < OUTBOX_PRUNE_BATCH_SIZE:
+            return deleted
+
+
+async def run_worker(stop: asyncio.Event | None = None) -> None:
+    stop = stop or asyncio.Event()
+    last_pruned = 0.0
+    while not stop.is_set():
+        if time.monotonic() - last_pruned >= OUTBOX_PRUNE_INTERVAL_SECONDS:
+            last_pruned = time.monotonic()
+            try:
+                pruned = await asyncio.to_thread(prune_processed)
+                if pruned:
+                    logger.info("Pruned %s processed outbox events", pruned)
+            except Exception:
+                logger.exception("Outbox prune failed")
+        try:
+            claimed = await asyncio.to_thread(drain_once)
+        except Exception:
+            logger.exception("Outbox drain failed")
+            claimed = 0
+        if claimed < OUTBOX_BATCH_SIZE:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=OUTBOX_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker())
@@ -0,0 +1,285 @@
+"""Appointment reminders.
+
+Only appointments starting within REMINDER_WINDOW_HOURS are held in memory, as
+a min-heap of (remind_at, appointment) entries. The appointments router keeps
+the heap current on create/update/cancel; the window is topped up from an
+indexed query as time advances, and re-seeded the same way after a restart.
+Reminder notifications get ids derived from (appointment, lead time), so
+missed reminders fire once after downtime and several API workers firing the
+same reminder insert it only once.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.cache import invalidate_dashboards
+from app.database import SessionLocal, engine
+from app.models import Appointment, Notification
+
+load_dotenv()
+
+# Minutes before the appointment at which reminders go out.
+REMINDER_LEAD_MINUTES = sorted(
+    (int(m) for m in os.getenv("REMINDER_LEAD_MINUTES", "1440,60").split(",")), reverse=True
+)
+REMINDER_WINDOW_HOURS = int(os.getenv("REMINDER_WINDOW_HOURS", 48))
+REMINDER_TICK_SECONDS = float(os.getenv("REMINDER_TICK_SECONDS", 30))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 500))
+
+TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p")
+REMINDER_NAMESPACE = uuid.UUID("0b6f1c6e-57a4-4f3a-9d0e-2f4a8f1b3c77")
+
+logger = logging.getLogger(__name__)
+
+
+def appointment_start(day: date, value: str) -> datetime | None:
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.combine(day, datetime.strptime(value.strip(), fmt).time())
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+
+@dataclass
+class Scheduled:
+    starts_at: datetime
+    version: int
+
+
+# Start-of-window rows only; served by ix_appointments_scheduled_date.
+WINDOW_SQL = text("""
+    SELECT id, date, time
+    FROM appointments
+    WHERE status = 'scheduled' AND date >= :first_day AND date <= :last_day
+""")
+
+# Re-read at fire time so cancels/reschedules made by other workers are honoured.
+DUE_SQL = text("""
+    SELECT a.id, a.date, a.time, a.type, p.user_id AS patient_user_id, d.user_id AS doctor_user_id
+    FROM appointments a
+    LEFT JOIN patients p ON p.id = a.patient_id
+    LEFT JOIN doctors d ON d.id = a.doctor_id
+    WHERE a.id = ANY(CAST(:ids AS uuid[])) AND a.status = 'scheduled'
+""")
+
+
+class ReminderScheduler:
+    def __init__(self):
+        self._heap: list[tuple[datetime, int, str, int]] = []
+        # appointment id -> current entry; heap entries with an older version are stale
+        self._scheduled: dict[str, Scheduled] = {}
+        self._loaded_until: datetime | None = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+    def _push(self, appointment_id: str, starts_at: datetime, now: datetime) -> None:
+        if starts_at <= now:
+            return
+        self._version += 1
+        self._scheduled[appointment_id] = Scheduled(starts_at, self._version)
+        for lead in REMINDER_LEAD_MINUTES:
+            remind_at = starts_at - timedelta(minutes=lead)
+            # Reminders for leads already passed when the appointment was booked are skipped,
+            # except that the shortest lead always fires while the appointment is still ahead.
+            if remind_at >= now or lead == REMINDER_LEAD_MINUTES[-1]:
+                heapq.heappush(self._heap, (remind_at, lead, appointment_id, self._version))
+
+    def schedule(self, appointment: Appointment) -> None:
+        """Add or move an appointment's reminders; no-op outside the loaded window."""
+        starts_at = appointment_start(appointment.date, appointment.time)
+        with self._lock:
+            self._scheduled.pop(str(appointment.id), None)
+            if (
+                appointment.status != "scheduled"
+                or starts_at is None
+                or self._loaded_until is None
+                or starts_at > self._loaded_until
+            ):
+                return
+            self._push(str(appointment.id), starts_at, datetime.now())
+
+    def unschedule(self, appointment_id) -> None:
+        with self._lock:
+            self._scheduled.pop(str(appointment_id), None)
+
+    def extend_window(self, now: datetime | None = None) -> int:
+        """Load appointments starting between the current horizon and now + REMINDER_WINDOW_HOURS."""
+        now = now or datetime.now()
+        horizon = now + timedelta(hours=REMINDER_WINDOW_HOURS)
+        start = self._loaded_until or now
+        if horizon <= start:
+            return 0
+        with engine.connect() as conn:
+            rows = conn.execute(WINDOW_SQL, {"first_day": start.date(), "last_day": horizon.date()}).all()
+        added = 0
+        with self._lock:
+            for row_id, day, value in rows:
+                appointment_id = str(row_id)
+                starts_at = appointment_start(day, value)
+                if starts_at is None or not (start <= starts_at <= horizon) or starts_at <= now:
+                    continue
+                if appointment_id not in self._scheduled:
+                    self._push(appointment_id, starts_at, now)
+                    added += 1
+            self._loaded_until = horizon
+        return added
+
+    def _pop_due(self, now: datetime) -> list[tuple[datetime, int, str, int]]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(due) < REMINDER_BATCH_SIZE:
+                entry = heapq.heappop(self._heap)
+                current = self._scheduled.get(entry[2])
+                if current is None or current.version != entry[3]:
+                    continue
+                due.append(entry)
+        return due
+
+    def _settle(self, due: list[tuple[datetime, int, str, int]], fired: bool) -> None:
+        """After a batch: forget appointments whose last reminder went out, or, if the
+        batch failed, put its entries back so the next tick retries them."""
+        with self._lock:
+            for entry in due:
+                remind_at, lead, appointment_id, version = entry
+                current = self._scheduled.get(appointment_id)
+                if current is None or current.version != version:
+                    # Rescheduled or cancelled while the batch ran.
+                    continue
+                if not fired:
+                    heapq.heappush(self._heap, entry)
+                elif lead == REMINDER_LEAD_MINUTES[-1]:
+                    # Shortest lead is always the last reminder for an appointment.
+                    del self._scheduled[appointment_id]
+
+    def fire_due(self, now: datetime | None = None) -> int:
+        """Insert reminder notifications for up to REMINDER_BATCH_SIZE due entries in one
+        multi-row insert. Returns the number of heap entries consumed."""
+        now = now or datetime.now()
+        due = self._pop_due(now)
+        if not due:
+            return 0
+        try:
+            self._fire(due, now)
+        except Exception:
+            self._settle(due, fired=False)
+            raise
+        self._settle(due, fired=True)
+        return len(due)
+
+    def _fire(self, due: list[tuple[datetime, int, str, int]], now: datetime) -> None:
+        db = SessionLocal()
+        try:
+            rows = {str(row.id): row for row in db.execute(DUE_SQL, {"ids": [d[2] for d in due]})}
+            notifications = []
+            for remind_at, lead, appointment_id, _ in due:
+                row = rows.get(appointment_id)
+                if row is None:
+                    continue
+                starts_at = appointment_start(row.date, row.time)
+                if starts_at != self._starts_at(remind_at, lead):
+                    # Moved by another worker: reschedule from the stored row instead.
+                    if starts_at is not None:
+                        with self._lock:
+                            self._push(appointment_id, starts_at, now)
+                    continue
+                message = f"Reminder: your {row.type} appointment is on {row.date} at {row.time}."
+                for user_id in (row.patient_user_id, row.doctor_user_id):
+                    if user_id is None:
+                        continue
+                    notifications.append({
+                        "id": uuid.uuid5(REMINDER_NAMESPACE, f"{appointment_id}:{lead}:{user_id}"),
+                        "user_id": user_id,
+                        "title": "Upcoming appointment",
+                        "message": message,
+                        "type": "info",
+                        "is_read": False,
+                        "link": f"/appointments/{appointment_id}",
+                        "created_at": remind_at,
+                    })
+            if notifications:
+                db.execute(
+                    insert(Notification).values(notifications)
+                    .on_conflict_do_nothing(index_elements=["id", "created_at"])
+                )
+                db.commit()
+                for n in notifications:
+                    invalidate_dashboards(f"user:{n['user_id']}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _starts_at(remind_at: datetime, lead: int) -> datetime:
+        return remind_at + timedelta(minutes=lead)
+
+    def next_due(self) -> datetime | None:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+
+scheduler = ReminderScheduler()
+
+
+# Arbitrary key; only one process builds the index at a time.
+INDEX_LOCK_KEY = 7_305_114_003
+
+
+def ensure_window_index() -> bool:
+    """create_all skips existing tables, so add the window-query index explicitly,
+    without blocking appointment writes. Returns True once a valid index exists.
+    Returns False when another process is building it, to be retried next tick."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": INDEX_LOCK_KEY}).scalar():
+            return False
+        try:
+            valid = conn.execute(text("""
+                SELECT i.indisvalid FROM pg_index i
+                WHERE i.indexrelid = to_regclass('ix_appointments_scheduled_date')
+            """)).scalar()
+            if valid:
+                return True
+            if valid is False:
+                # Left behind by an interrupted CONCURRENTLY build.
+                conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_appointments_scheduled_date"))
+            conn.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointments_scheduled_date
+                ON appointments (date) WHERE status = 'scheduled'
+            """))
+            return True
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": INDEX_LOCK_KEY})
+
+
+async def run_scheduler(stop: asyncio.Event) -> None:
+    index_ready = False
+    while not stop.is_set():
+        failed = False
+        try:
+            if not index_ready:
+                index_ready = await asyncio.to_thread(ensure_window_index)
+            await asyncio.to_thread(scheduler.extend_window)
+            while await asyncio.to_thread(scheduler.fire_due) > 0:
+                pass
+        except Exception:
+            logger.exception("Reminder scheduler tick failed")
+            failed = True
+        next_due = scheduler.next_due()
+        timeout = REMINDER_TICK_SECONDS
+        if next_due is not None and not failed:
+            timeout = min(timeout, max(0.0, (next_due - datetime.now()).total_seconds()))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
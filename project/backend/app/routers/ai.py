@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from app.ai_gateway import AI_CHAT_MAX_MESSAGE_CHARS, gateway
+from app.schemas import SymptomAnalysisRequest, SymptomAnalysisOut, ChatRequest
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt
+import json
+import logging
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+
+router = APIRouter()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+logger = logging.getLogger(__name__)
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return {"id": payload.get("sub"), "role": payload.get("role")}
+    except:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+@router.post("/analyze", response_model=SymptomAnalysisOut)
+async def analyze_symptoms(data: SymptomAnalysisRequest, current_user: dict = Depends(get_current_user)):
+    """Triage symptoms; identical symptom sets are served from cache or share one in-flight call"""
+    if not data.symptoms and not data.description.strip():
+        raise HTTPException(status_code=400, detail="Provide symptoms or a description")
+    analysis, cached = await gateway.analyze_symptoms(data.symptoms, data.description)
+    return {**analysis, "cached": cached}
+
+
+@router.post("/chat")
+async def chat(data: ChatRequest, current_user: dict = Depends(get_current_user)):
+    """Stream the assistant's reply as server-sent events: data: {"token": ...} ... data: [DONE]"""
+    if len(data.message) > AI_CHAT_MAX_MESSAGE_CHARS:
+        raise HTTPException(status_code=400, detail=f"Message is longer than {AI_CHAT_MAX_MESSAGE_CHARS} characters")
+    history = [{"role": m.role, "content": m.content} for m in data.history if m.role in ("user", "assistant")]
+
+    async def events():
+        try:
+            async for token in gateway.chat(data.message, history):
+                yield f"data: {json.dumps({'token': token})}\n\n"
+        except Exception:
+            logger.exception("AI chat stream failed")
+            yield f"data: {json.dumps({'error': 'The assistant is unavailable, please try again.'})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stats")
+def get_stats(current_user: dict = Depends(get_current_user)):
+    """Cache hit rate and upstream latency, for benchmarking against the stub model"""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return gateway.snapshot()
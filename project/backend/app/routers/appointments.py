@@ -3,6 +3,10 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import Appointment, Patient, Doctor, User
 from app.schemas import AppointmentCreate, AppointmentOut
+from app.core.cache import invalidate_dashboards
+from app.core.response_cache import invalidate_responses
+from app.outbox import enqueue
+from app.reminders import scheduler as reminder_scheduler
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 import os
@@ -25,6 +29,33 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+def invalidate_appointment_caches(db: Session, appointment: Appointment, *extra_doctor_ids):
+    """Drop cached dashboards and appointment lists for everyone who can see this appointment"""
+    doctor_ids = {appointment.doctor_id, *extra_doctor_ids}
+    invalidate_dashboards(
+        f"patient:{appointment.patient_id}",
+        *(f"doctor:{doctor_id}" for doctor_id in doctor_ids),
+    )
+    patient_user_id = db.query(Patient.user_id).filter(Patient.id == appointment.patient_id).scalar()
+    doctor_user_ids = [
+        user_id for (user_id,) in db.query(Doctor.user_id).filter(Doctor.id.in_(doctor_ids)).all()
+    ]
+    invalidate_responses(
+        "appointments:admin",
+        *(f"appointments:{user_id}" for user_id in [patient_user_id, *doctor_user_ids] if user_id),
+    )
+
+
+def appointment_event_payload(appointment: Appointment) -> dict:
+    return {
+        "patient_id": str(appointment.patient_id),
+        "doctor_id": str(appointment.doctor_id),
+        "date": appointment.date.isoformat(),
+        "time": appointment.time,
+        "type": appointment.type,
+    }
+
+
 @router.post("/", response_model=AppointmentOut)
 def create_appointment(
     data: AppointmentCreate,
@@ -46,8 +77,12 @@ def create_appointment(
         status="scheduled"
     )
     db.add(appointment)
+    db.flush()
+    enqueue(db, "appointment", appointment.id, "appointment.created", appointment_event_payload(appointment))
     db.commit()
     db.refresh(appointment)
+    invalidate_appointment_caches(db, appointment)
+    reminder_scheduler.schedule(appointment)
     return appointment
 
 
@@ -132,11 +167,14 @@ def update_appointment(
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
+    previous_doctor_id = appointment.doctor_id
     for key, value in data.dict(exclude_unset=True).items():
         setattr(appointment, key, value)
     
     db.commit()
     db.refresh(appointment)
+    invalidate_appointment_caches(db, appointment, previous_doctor_id)
+    reminder_scheduler.schedule(appointment)
     return appointment
 
 
@@ -152,5 +190,8 @@ def cancel_appointment(
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     appointment.status = "cancelled"
+    enqueue(db, "appointment", appointment.id, "appointment.cancelled", appointment_event_payload(appointment))
     db.commit()
+    invalidate_appointment_caches(db, appointment)
+    reminder_scheduler.unschedule(appointment.id)
     return {"message": "Appointment cancelled successfully"}
\ No newline at end of file
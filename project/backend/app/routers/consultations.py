@@ -4,6 +4,8 @@ from app.database import get_db
 from app.models import Consultation, Patient
 from app.schemas import ConsultationCreate, ConsultationOut
 from app.ai_integration import generate_ai_recommendation
+from app.core.cache import invalidate_dashboards
+from app.outbox import enqueue
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 import os
@@ -36,8 +38,11 @@ def create_consultation(data: ConsultationCreate, db: Session = Depends(get_db),
         ai_recommendation=ai_rec
     )
     db.add(consultation)
+    db.flush()
+    enqueue(db, "consultation", consultation.id, "consultation.created", {"patient_id": str(patient.id)})
     db.commit()
     db.refresh(consultation)
+    invalidate_dashboards(f"patient:{patient.id}", "doctors")
     return consultation
 
 @router.get("/", response_model=list[ConsultationOut])
@@ -0,0 +1,200 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.core.cache import dashboard_cache
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+
+router = APIRouter()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return {"id": payload.get("sub"), "role": payload.get("role")}
+    except:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+# Everything the patient dashboard renders, collected in a single statement.
+PATIENT_DASHBOARD_SQL = text("""
+    WITH me AS (
+        SELECT id, user_id, date_of_birth, gender, phone, address, created_at
+        FROM patients
+        WHERE user_id = :user_id
+    ),
+    my_consultations AS (
+        SELECT c.*
+        FROM consultations c
+        JOIN me ON c.patient_id = me.id
+    ),
+    upcoming AS (
+        SELECT a.*
+        FROM appointments a
+        JOIN me ON a.patient_id = me.id
+        WHERE a.date >= CURRENT_DATE AND a.status = 'scheduled'
+        ORDER BY a.date, a.time
+        LIMIT 5
+    )
+    SELECT
+        (SELECT row_to_json(me) FROM me) AS patient,
+        COALESCE(
+            (SELECT json_agg(c ORDER BY c.created_at DESC) FROM my_consultations c),
+            '[]'::json
+        ) AS consultations,
+        (
+            SELECT json_build_object(
+                'total', count(*),
+                'pending', count(*) FILTER (WHERE status = 'pending'),
+                'active', count(*) FILTER (WHERE status = 'assigned'),
+                'completed', count(*) FILTER (WHERE status = 'completed')
+            )
+            FROM my_consultations
+        ) AS stats,
+        COALESCE(
+            (SELECT json_agg(u ORDER BY u.date, u.time) FROM upcoming u),
+            '[]'::json
+        ) AS upcoming_appointments,
+        COALESCE(
+            (SELECT json_agg(s ORDER BY s.category, s.name) FROM symptoms s),
+            '[]'::json
+        ) AS symptoms,
+        (
+            SELECT count(*)
+            FROM notifications n
+            WHERE n.user_id = :user_id AND n.is_read = false
+        ) AS unread_notifications
+""")
+
+# Assigned + open pending consultations (with patient names), appointment
+# agenda and counters for the doctor dashboard, in a single statement.
+DOCTOR_DASHBOARD_SQL = text("""
+    WITH me AS (
+        SELECT id, user_id, specialization, license_number, years_of_experience,
+               bio, is_verified, created_at
+        FROM doctors
+        WHERE user_id = :user_id
+    ),
+    visible AS (
+        SELECT c.*,
+               json_build_object(
+                   'id', p.id,
+                   'user_id', p.user_id,
+                   'full_name', u.full_name,
+                   'gender', p.gender,
+                   'date_of_birth', p.date_of_birth
+               ) AS patient
+        FROM consultations c
+        JOIN me ON c.doctor_id = me.id
+                OR (c.doctor_id IS NULL AND c.status = 'pending')
+        LEFT JOIN patients p ON p.id = c.patient_id
+        LEFT JOIN users u ON u.id = p.user_id
+    ),
+    upcoming AS (
+        SELECT a.*, u.full_name AS patient_name
+        FROM appointments a
+        JOIN me ON a.doctor_id = me.id
+        LEFT JOIN patients p ON p.id = a.patient_id
+        LEFT JOIN users u ON u.id = p.user_id
+        WHERE a.date >= CURRENT_DATE AND a.status = 'scheduled'
+        ORDER BY a.date, a.time
+        LIMIT 10
+    )
+    SELECT
+        (SELECT row_to_json(me) FROM me) AS doctor,
+        COALESCE(
+            (SELECT json_agg(v ORDER BY v.created_at DESC)
+             FILTER (WHERE v.doctor_id IS NOT NULL) FROM visible v),
+            '[]'::json
+        ) AS assigned_consultations,
+        COALESCE(
+            (SELECT json_agg(v ORDER BY v.created_at DESC)
+             FILTER (WHERE v.doctor_id IS NULL) FROM visible v),
+            '[]'::json
+        ) AS pending_consultations,
+        (
+            SELECT json_build_object(
+                'pending', count(*) FILTER (WHERE doctor_id IS NULL),
+                'active', count(*) FILTER (WHERE doctor_id IS NOT NULL AND status = 'assigned'),
+                'completed', count(*) FILTER (WHERE doctor_id IS NOT NULL AND status = 'completed'),
+                'total_patients', count(DISTINCT patient_id) FILTER (WHERE doctor_id IS NOT NULL)
+            )
+            FROM visible
+        ) AS stats,
+        COALESCE(
+            (SELECT json_agg(u ORDER BY u.date, u.time) FROM upcoming u),
+            '[]'::json
+        ) AS upcoming_appointments,
+        (
+            SELECT count(*)
+            FROM notifications n
+            WHERE n.user_id = :user_id AND n.is_read = false
+        ) AS unread_notifications
+""")
+
+
+@router.get("/patient")
+def get_patient_dashboard(db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Patient record, consultations, stats, upcoming appointments, symptoms and unread count in one call"""
+    if current_user["role"] != "patient":
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    cache_key = f"patient:{current_user['id']}"
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Taken before the query: a write invalidating these tags while it runs
+    # keeps this (possibly pre-write) payload out of the cache.
+    snapshot = dashboard_cache.snapshot()
+    params = {"user_id": current_user["id"]}
+    row = db.execute(PATIENT_DASHBOARD_SQL, params).mappings().one()
+    if row["patient"] is None:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    dashboard = dict(row)
+    dashboard_cache.set(
+        cache_key,
+        dashboard,
+        tags=(f"user:{current_user['id']}", f"patient:{row['patient']['id']}", "symptoms"),
+        since=snapshot,
+    )
+    return dashboard
+
+
+@router.get("/doctor")
+def get_doctor_dashboard(db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    """Doctor record, assigned and pending consultations, stats, agenda and unread count in one call"""
+    if current_user["role"] != "doctor":
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    cache_key = f"doctor:{current_user['id']}"
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Taken before the query: a write invalidating these tags while it runs
+    # keeps this (possibly pre-write) payload out of the cache.
+    snapshot = dashboard_cache.snapshot()
+    params = {"user_id": current_user["id"]}
+    row = db.execute(DOCTOR_DASHBOARD_SQL, params).mappings().one()
+    if row["doctor"] is None:
+        raise HTTPException(status_code=404, detail="Doctor not found")
+
+    dashboard = dict(row)
+    # "doctors" covers the shared pending queue, which any new consultation changes.
+    dashboard_cache.set(
+        cache_key,
+        dashboard,
+        tags=(f"user:{current_user['id']}", f"doctor:{row['doctor']['id']}", "doctors"),
+        since=snapshot,
+    )
+    return dashboard
@@ -3,6 +3,8 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import Doctor
 from app.schemas import PatientCreate
+from app.core.cache import invalidate_dashboards
+from app.core.response_cache import invalidate_responses
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 import os
@@ -56,4 +58,6 @@ def update_my_profile(data: PatientCreate, db: Session = Depends(get_db), curren
         setattr(doctor, key, value)
     db.commit()
     db.refresh(doctor)
+    invalidate_dashboards(f"user:{current_user['id']}")
+    invalidate_responses(f"doctor-profile:{current_user['id']}", "doctors")
     return doctor
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from typing import Optional
+from app.bulk_import import IMPORT_SCHEMAS, run_import
+from app.schemas import ImportReport
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+
+router = APIRouter()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return {"id": payload.get("sub"), "role": payload.get("role")}
+    except:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+@router.post("/{kind}", response_model=ImportReport)
+async def bulk_import(
+    kind: str,
+    request: Request,
+    format: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """Import patients, doctors or appointments from a CSV or NDJSON request body.
+
+    The format comes from ?format=csv|ndjson or the Content-Type header. Rows are
+    committed chunk by chunk; the report lists every rejected row by number.
+    """
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if kind not in IMPORT_SCHEMAS:
+        raise HTTPException(status_code=404, detail=f"Unknown import kind: {kind}")
+
+    content_type = request.headers.get("content-type", "")
+    fmt = format or ("ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv")
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+
+    return await run_import(kind, request.stream(), fmt)
@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import Notification
 from app.schemas import NotificationOut
+from app.core.cache import invalidate_dashboards
+from app.notification_retention import hot_cutoff
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 import os
 from dotenv import load_dotenv
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -29,15 +33,24 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
 def get_notifications(
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user),
-    unread_only: bool = False
+    unread_only: bool = False,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[datetime] = None
 ):
-    """Get all notifications for current user"""
-    query = db.query(Notification).filter(Notification.user_id == current_user["id"])
+    """Get notifications for current user, newest first: read ones from the hot
+    window, unread ones however old. Page with before=<created_at of the last item>."""
+    query = db.query(Notification).filter(
+        Notification.user_id == current_user["id"],
+        # Unread notifications are never archived, so they stay listed until read
+        or_(Notification.created_at >= hot_cutoff(), Notification.is_read == False)
+    )
     
     if unread_only:
         query = query.filter(Notification.is_read == False)
+    if before is not None:
+        query = query.filter(Notification.created_at < before)
     
-    notifications = query.order_by(Notification.created_at.desc()).all()
+    notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
     return notifications
 
 
@@ -72,6 +85,7 @@ def mark_as_read(
     
     notification.is_read = True
     db.commit()
+    invalidate_dashboards(f"user:{current_user['id']}")
     return {"message": "Notification marked as read"}
 
 
@@ -87,6 +101,7 @@ def mark_all_as_read(
     ).update({"is_read": True})
     
     db.commit()
+    invalidate_dashboards(f"user:{current_user['id']}")
     return {"message": "All notifications marked as read"}
 
 
@@ -107,4 +122,5 @@ def delete_notification(
     
     db.delete(notification)
     db.commit()
+    invalidate_dashboards(f"user:{current_user['id']}")
     return {"message": "Notification deleted"}
\ No newline at end of file
@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from app.core.profiling import PROFILING_ENABLED, profiles
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = os.getenv("ALGORITHM", "HS256")
+
+router = APIRouter()
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return {"id": payload.get("sub"), "role": payload.get("role")}
+    except:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def require_admin(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set PROFILING_ENABLED=true)")
+    return current_user
+
+
+@router.get("/requests")
+def list_profiles(
+    path: Optional[str] = None,
+    min_ms: float = 0,
+    reason: Optional[str] = None,
+    limit: int = 50,
+    current_user: dict = Depends(require_admin),
+):
+    """Captured requests, newest first; filter by path prefix, minimum latency or reason (header, sampled, slow)"""
+    return [p.summary() for p in profiles.query(path=path, min_ms=min_ms, reason=reason, limit=limit)]
+
+
+@router.get("/requests/{profile_id}")
+def get_profile(profile_id: str, current_user: dict = Depends(require_admin)):
+    """Timing breakdown, SQL statements and hottest sampled stacks of one captured request"""
+    profile = profiles.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.detail()
+
+
+@router.get("/flamegraph", response_class=PlainTextResponse)
+def get_flamegraph(
+    profile_id: Optional[str] = None,
+    path: Optional[str] = None,
+    min_ms: float = 0,
+    limit: int = 200,
+    current_user: dict = Depends(require_admin),
+):
+    """Sampled stacks in collapsed format ("frame;frame;frame count"), for flamegraph.pl or speedscope"""
+    if profile_id:
+        profile = profiles.get(profile_id)
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        selected = [profile]
+    else:
+        selected = profiles.query(path=path, min_ms=min_ms, limit=limit)
+    return "\n".join(line for p in selected for line in p.collapsed_stacks()) + "\n"
+
+
+@router.delete("/requests")
+def clear_profiles(current_user: dict = Depends(require_admin)):
+    profiles.clear()
+    return {"message": "Captured profiles cleared"}
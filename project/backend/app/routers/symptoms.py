@@ -4,6 +4,7 @@ from app.database import get_db
 from app.models import Symptom
 from app.schemas import SymptomCreate, SymptomOut
 from app.auth import get_current_user
+from app.core.cache import invalidate_dashboards
 
 router = APIRouter(prefix="/symptoms", tags=["Symptoms"])
 
@@ -17,6 +18,7 @@ def create_symptom(
     db.add(symptom)
     db.commit()
     db.refresh(symptom)
+    invalidate_dashboards("symptoms")
     return symptom
 
 @router.get("/", response_model=list[SymptomOut])
@@ -107,3 +107,62 @@ class NotificationOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+class SymptomAnalysisRequest(BaseModel):
+    symptoms: List[str]
+    description: str = ""
+
+class SymptomAnalysisOut(BaseModel):
+    priority: str  # urgent, high, medium, low
+    recommendation: str
+    specialty: str
+    follow_up_questions: List[str]
+    cached: bool = False
+
+class ChatMessage(BaseModel):
+    role: str  # user, assistant
+    content: str
+
+class ChatRequest(BaseModel):
+    message: str
+    history: List[ChatMessage] = []
+
+class PatientImportRow(BaseModel):
+    email: EmailStr
+    full_name: str
+    password: str
+    date_of_birth: Optional[date] = None
+    gender: Optional[str] = None
+    phone: Optional[str] = None
+    address: Optional[str] = None
+
+class DoctorImportRow(BaseModel):
+    email: EmailStr
+    full_name: str
+    password: str
+    specialization: Optional[str] = None
+    license_number: Optional[str] = None
+    years_of_experience: int = 0
+    bio: Optional[str] = None
+    is_verified: bool = False
+
+class AppointmentImportRow(BaseModel):
+    patient_email: EmailStr
+    doctor_email: EmailStr
+    date: date
+    time: str
+    type: str  # video or in-person
+    location: Optional[str] = None
+    status: str = "completed"  # scheduled, completed, cancelled
+    notes: Optional[str] = None
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    kind: str
+    total: int
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
@@ -0,0 +1,5 @@
+import os
+
+# app modules read these at import time; the tests never open a database connection.
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://localhost/test")
@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+import pytest
+
+from app.ai_gateway import AIGateway, parse_analysis
+
+VALID = {
+    "priority": "high",
+    "recommendation": "See a doctor today.",
+    "specialty": "General Practitioner",
+    "followUpQuestions": ["When did it start?"],
+}
+
+
+def test_parse_analysis_accepts_fenced_reply():
+    analysis = parse_analysis("```json\n" + json.dumps(VALID) + "\n```")
+    assert analysis == {
+        "priority": "high",
+        "recommendation": "See a doctor today.",
+        "specialty": "General Practitioner",
+        "follow_up_questions": ["When did it start?"],
+    }
+
+
+@pytest.mark.parametrize("reply", [
+    {**VALID, "followUpQuestions": "When did it start?"},
+    {**VALID, "followUpQuestions": [1, 2]},
+    {**VALID, "priority": "critical"},
+    {**VALID, "specialty": 42},
+    ["not", "an", "object"],
+])
+def test_parse_analysis_rejects_malformed_reply(reply):
+    with pytest.raises(ValueError):
+        parse_analysis(json.dumps(reply))
+
+
+class OneReplyModel:
+    def __init__(self, reply: dict):
+        self.reply = reply
+        self.calls = 0
+
+    async def complete(self, messages, max_tokens=500):
+        self.calls += 1
+        return json.dumps(self.reply)
+
+
+def test_malformed_reply_falls_back_uncached():
+    model = OneReplyModel({**VALID, "followUpQuestions": "When did it start?"})
+    gateway = AIGateway(model)
+
+    async def analyze_twice():
+        return [await gateway.analyze_symptoms(["fever"], "") for _ in range(2)]
+
+    results = asyncio.run(analyze_twice())
+    assert [cached for _, cached in results] == [False, False]
+    assert results[0][0]["priority"] == "high"  # rule-based fallback for "fever"
+    assert model.calls == 2
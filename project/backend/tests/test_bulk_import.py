@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.dml import Insert
+
+from app import bulk_import
+
+
+async def _stream(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def parse(body: str, fmt: str, size: int = 7) -> list:
+    async def collect():
+        return [record async for record in bulk_import.iter_records(_stream(body.encode(), size), fmt)]
+    return asyncio.run(collect())
+
+
+def run_import(kind: str, body: str, fmt: str = "csv") -> dict:
+    return asyncio.run(bulk_import.run_import(kind, _stream(body.encode(), 64), fmt))
+
+
+# =====================
+# PARSING
+# =====================
+
+def test_csv_quoted_field_spanning_lines_and_chunks():
+    records = parse('email,full_name,address\r\na@x.com,"Ann\nLee","1 Main St, Apt ""B"""\r\nb@x.com,Bob,\n', "csv")
+    assert records == [
+        (1, {"email": "a@x.com", "full_name": "Ann\nLee", "address": '1 Main St, Apt "B"'}, None),
+        # Empty cells are dropped so the schema defaults apply.
+        (2, {"email": "b@x.com", "full_name": "Bob"}, None),
+    ]
+
+
+def test_csv_column_count_mismatch_is_reported_per_row():
+    records = parse("email,full_name\na@x.com\nb@x.com,Bob\n", "csv")
+    assert records == [
+        (1, None, "Expected 2 columns, got 1"),
+        (2, {"email": "b@x.com", "full_name": "Bob"}, None),
+    ]
+
+
+def test_csv_stray_quote_in_unquoted_cell_is_literal():
+    records = parse('email,full_name,bio\na@x.com,Ann,Is 6" tall\nb@x.com,Bob,ok\nc@x.com,Cy,\n', "csv")
+    assert records == [
+        (1, {"email": "a@x.com", "full_name": "Ann", "bio": 'Is 6" tall'}, None),
+        (2, {"email": "b@x.com", "full_name": "Bob", "bio": "ok"}, None),
+        (3, {"email": "c@x.com", "full_name": "Cy"}, None),
+    ]
+
+
+def test_csv_unterminated_quote_fails_its_row_only():
+    records = parse('email,full_name\na@x.com,"Ann\nb@x.com,Bob\n', "csv")
+    assert records == [
+        (1, None, "Unterminated quoted field"),
+        (2, {"email": "b@x.com", "full_name": "Bob"}, None),
+    ]
+
+
+def test_csv_record_longer_than_limit_is_not_buffered(monkeypatch):
+    monkeypatch.setattr(bulk_import, "IMPORT_MAX_RECORD_CHARS", 40)
+    body = 'email,full_name\na@x.com,"never closed\n' + "a,b\n" * 20 + 'b@x.com,Bob\n'
+    records = parse(body, "csv")
+    assert records[0] == (1, None, "Record is longer than 40 characters")
+    assert records[-1] == (22, {"email": "b@x.com", "full_name": "Bob"}, None)
+
+
+def test_ndjson_bad_lines_do_not_stop_parsing():
+    records = parse('{"email": "a@x.com"}\nnot json\n\n[1, 2]\n{"email": "b@x.com"}', "ndjson")
+    assert records[0] == (1, {"email": "a@x.com"}, None)
+    assert records[1][0] == 2 and records[1][1] is None and records[1][2].startswith("Invalid JSON")
+    assert records[2] == (3, None, "Expected a JSON object")
+    assert records[3] == (4, {"email": "b@x.com"}, None)
+
+
+# =====================
+# CHUNK ERRORS
+# =====================
+
+class FakeResult:
+    def scalars(self):
+        return []
+
+
+class FakeSession:
+    """Finds no existing emails; INSERTs raise for the sessions listed in fail_sessions."""
+
+    opened = 0
+
+    def __init__(self, fail_sessions: set):
+        FakeSession.opened += 1
+        self.fail = FakeSession.opened in fail_sessions
+        self.rolled_back = False
+        self.committed = False
+
+    def execute(self, statement):
+        if isinstance(statement, Insert):
+            if self.fail:
+                raise IntegrityError("INSERT INTO users ...", {}, Exception("duplicate key value violates unique constraint"))
+            return None
+        return FakeResult()
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    sessions = []
+
+    def use(fail_sessions=()):
+        FakeSession.opened = 0
+
+        def factory():
+            session = FakeSession(set(fail_sessions))
+            sessions.append(session)
+            return session
+
+        monkeypatch.setattr(bulk_import, "SessionLocal", factory)
+        return sessions
+
+    monkeypatch.setattr(bulk_import, "hash_password", lambda password: "hashed:" + password)
+    monkeypatch.setattr(bulk_import, "invalidate_dashboards", lambda *tags: None)
+    monkeypatch.setattr(bulk_import, "invalidate_responses", lambda *tags: None)
+    return use
+
+
+def test_rejected_insert_rolls_back_chunk_and_reports_rows(fake_db):
+    sessions = fake_db(fail_sessions={1})
+    report = run_import("patients", "email,full_name,password\na@x.com,Ann,pw\nb@x.com,Bob,pw\n")
+    assert report["imported"] == 0
+    assert report["failed"] == 2
+    assert [e["row"] for e in report["errors"]] == [1, 2]
+    assert all(e["error"].startswith("Chunk rolled back: duplicate key") for e in report["errors"])
+    assert sessions[0].rolled_back and not sessions[0].committed
+
+
+def test_failed_chunk_keeps_other_chunks(fake_db, monkeypatch):
+    monkeypatch.setattr(bulk_import, "IMPORT_CHUNK_SIZE", 2)
+    sessions = fake_db(fail_sessions={2})
+    body = "email,full_name,password\n" + "".join(f"u{i}@x.com,U{i},pw\n" for i in range(5))
+    report = run_import("doctors", body)
+    assert report["total"] == 5
+    assert report["imported"] == 3
+    assert [e["row"] for e in report["errors"]] == [3, 4]
+    assert [s.committed for s in sessions] == [True, False, True]
@@ -0,0 +1,28 @@
+from app.core.cache import TaggedTTLCache
+
+
+def test_set_skipped_when_tag_invalidated_after_snapshot():
+    cache = TaggedTTLCache()
+    snapshot = cache.snapshot()
+    cache.invalidate_tags("patient:1")
+    assert cache.set("patient:u1", "stale", tags=("user:u1", "patient:1"), since=snapshot) is False
+    assert cache.get("patient:u1") is None
+
+
+def test_set_kept_when_other_tags_invalidated():
+    cache = TaggedTTLCache()
+    snapshot = cache.snapshot()
+    cache.invalidate_tags("patient:2")
+    assert cache.set("patient:u1", "fresh", tags=("user:u1", "patient:1"), since=snapshot) is True
+    assert cache.get("patient:u1") == "fresh"
+    # A snapshot taken after the invalidation is not affected by it.
+    assert cache.set("patient:u2", "fresh", tags=("patient:2",), since=cache.snapshot()) is True
+
+
+def test_snapshot_older_than_bounded_history_is_stale():
+    cache = TaggedTTLCache(max_entries=1)
+    snapshot = cache.snapshot()
+    for i in range(17):
+        cache.invalidate_tags(f"user:{i}")
+    assert cache.set("k", "v", tags=("user:other",), since=snapshot) is False
+    assert cache.set("k", "v", tags=("user:other",), since=cache.snapshot()) is True
@@ -0,0 +1,47 @@
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.core.rate_limit import ConcurrencyLimitMiddleware, FailOpenBucketStore, Limit, MemoryBucketStore
+
+
+def test_stream_holds_its_slot_until_the_body_is_sent():
+    seen = []
+
+    async def stream(request):
+        async def body():
+            for _ in range(3):
+                seen.append(dict(middleware.in_flight))
+                yield "x"
+        return StreamingResponse(body())
+
+    async def plain(request):
+        seen.append(dict(middleware.in_flight))
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/ai/chat", stream), Route("/doctors", plain)])
+    middleware = ConcurrencyLimitMiddleware(app)
+    client = TestClient(middleware)
+
+    assert client.get("/ai/chat").text == "xxx"
+    assert seen == [{"db": 0, "ai": 1}] * 3
+    assert middleware.in_flight == {"db": 0, "ai": 0}
+
+    middleware.limits["db"] = 0
+    assert client.get("/doctors").status_code == 503
+    assert client.get("/ai/chat").status_code == 200
+
+
+def test_fail_open_store_leaves_failing_primary_alone():
+    class Down:
+        calls = 0
+
+        def take(self, key, limit):
+            Down.calls += 1
+            raise ConnectionError("Redis is down")
+
+    store = FailOpenBucketStore(Down(), MemoryBucketStore())
+    limit = Limit(capacity=2, refill_per_second=0.001)
+    assert [store.take("k", limit) == 0 for _ in range(3)] == [True, True, False]
+    assert Down.calls == 1
@@ -0,0 +1,34 @@
+from app.core.response_cache import CachedResponse, LocalSharedStore, SharedBackend
+
+ENTRY = CachedResponse(body=b"[]", media_type="application/json", etag='"x"', last_modified=0.0)
+
+
+def test_shared_backend_skips_store_after_invalidation():
+    backend = SharedBackend(LocalSharedStore(), ttl_seconds=60)
+    generations = backend.generations(["doctors"])
+    backend.invalidate_tags("doctors")
+    backend.set("k", ENTRY, ["doctors"], generations)
+    assert backend.get("k") is None
+    backend.set("k", ENTRY, ["doctors"], backend.generations(["doctors"]))
+    assert backend.get("k") == ENTRY
+
+
+class FailingClient:
+    def __init__(self):
+        self.calls = 0
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls += 1
+            raise ConnectionError("Redis is down")
+        return call
+
+
+def test_shared_backend_bypasses_client_after_failure():
+    client = FailingClient()
+    backend = SharedBackend(client, ttl_seconds=60)
+    assert backend.get("k") is None
+    assert backend.generations(["doctors"]) is None
+    backend.set("k", ENTRY, ["doctors"], ())
+    backend.invalidate_tags("doctors")
+    assert client.calls == 1